@@ -1,3 +1,9 @@
-from .app import create_app
-
 __all__ = ["create_app"]
+
+
+def __getattr__(name):
+	# Lazy so `python -m anomidate_web.db` does not pull in Flask and every blueprint
+	if name == "create_app":
+		from .app import create_app
+		return create_app
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
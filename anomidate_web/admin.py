@@ -1,6 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from flask_login import login_required
-from .db import connect
+from .db import get_db
+from .routes_matches import forget_pair, pair_cache_stats, remove_mutual_match
+from .roblox import avatar_cache_stats, get_avatar_urls
+from .http_client import breaker_stats, endpoint_stats
+from . import jobs, stats, verification
+from .auth import forget_user, user_cache_stats
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
 
@@ -45,95 +50,140 @@ def logout():
 def dashboard():
 	if not _is_admin():
 		return redirect(url_for("admin.login"))
-	# Simple stats
-	conn = connect()
-	cur = conn.cursor()
-	cur.execute("SELECT COUNT(*) AS c FROM users")
-	row = cur.fetchone()
-	total_users = row["c"] if row else 0
-	cur.execute("SELECT COUNT(*) AS c FROM mutual_matches")
-	row = cur.fetchone()
-	total_matches = row["c"] if row else 0
-	cur.execute("SELECT COUNT(*) AS c FROM messages")
-	row = cur.fetchone()
-	total_msgs = row["c"] if row else 0
-	conn.close()
-	return render_template("admin_dashboard.html", total_users=total_users, total_matches=total_matches, total_msgs=total_msgs)
+	# Trigger-maintained counters and daily rollups (see stats.py); no fact-table scans
+	counts = stats.totals()
+	days, series = stats.daily()
+	trends = [
+		{"name": name, "label": label, "values": series[name], "total": sum(series[name]), "peak": max(series[name]) or 1}
+		for name, label in stats.DAILY_SERIES
+	]
+	return render_template(
+		"admin_dashboard.html",
+		total_users=counts.get("users", 0),
+		total_matches=counts.get("mutual_matches", 0),
+		total_msgs=counts.get("messages", 0),
+		days=days,
+		trends=trends,
+	)
+
+
+@admin_bp.route("/stats/cache")
+def cache_stats():
+	if not _is_admin():
+		return redirect(url_for("admin.login"))
+	return jsonify({"avatars": avatar_cache_stats(), "verification": verification.cache_stats(), "users": user_cache_stats(), "pairs": pair_cache_stats()})
+
+
+@admin_bp.route("/stats/http")
+def http_stats():
+	if not _is_admin():
+		return redirect(url_for("admin.login"))
+	return jsonify({"endpoints": endpoint_stats(), "breakers": breaker_stats()})
 
 
 @admin_bp.route("/wipe", methods=["POST"])
 def wipe_all_data():
 	if not _is_admin():
 		return redirect(url_for("admin.login"))
-	conn = connect()
-	cur = conn.cursor()
-	# Order matters due to FK-like relationships
-	cur.execute("DELETE FROM messages")
-	cur.execute("DELETE FROM mutual_matches")
-	cur.execute("DELETE FROM matches")
-	cur.execute("DELETE FROM daily_swipes")
-	cur.execute("DELETE FROM roblox_verification")
-	cur.execute("DELETE FROM password_resets")
-	cur.execute("DELETE FROM users")
-	conn.commit()
-	conn.close()
-	flash("All user accounts and related data were deleted", "success")
+	# "rows" deletes in chunks instead of swapping in a fresh database file
+	kind = jobs.WIPE_ROWS if request.form.get("mode") == "rows" else jobs.WIPE
+	job_id = jobs.submit(kind)
+	flash(f"Deleting all user data in the background (job {job_id}: {url_for('admin.job_status', job_id=job_id)})", "success")
 	return redirect(url_for("admin.dashboard"))
 
 
+@admin_bp.route("/jobs/<int:job_id>")
+def job_status(job_id: int):
+	if not _is_admin():
+		return redirect(url_for("admin.login"))
+	job = jobs.get(job_id)
+	if job is None:
+		return jsonify({"error": "not found"}), 404
+	return jsonify(job)
+
+
+USERS_PAGE_SIZE = 25
+USERS_COUNT_CAP = 1000
+
+
+def _user_search(q: str):
+	"""SQL condition and params restricting users to those matching q."""
+	if len(q) >= 3:
+		# Trigram index: case-insensitive substring match on any indexed column
+		return "users.id IN (SELECT rowid FROM users_fts WHERE users_fts MATCH ?)", ['"%s"' % q.replace('"', '""')]
+	# Too short for trigrams; a capped scan is fine for one or two characters
+	like = f"%{q}%"
+	return "(users.username LIKE ? OR users.discord_id LIKE ? OR users.email LIKE ?)", [like, like, like]
+
+
 @admin_bp.route("/users")
 def users():
 	if not _is_admin():
 		return redirect(url_for("admin.login"))
 	q = request.args.get("q", "").strip()
-	page = max(int(request.args.get("page", 1) or 1), 1)
-	page_size = 25
-	offset = (page - 1) * page_size
-	conn = connect()
+	cursor = request.args.get("cursor", type=int)
+	conn = get_db()
 	cur = conn.cursor()
-	params = []
-	where = ""
+	clauses, params = [], []
 	if q:
-		where = "WHERE username LIKE ? OR discord_id LIKE ?"
-		like = f"%{q}%"
-		params.extend([like, like])
-	cur.execute(f"SELECT COUNT(*) AS c FROM users {where}", params)
-	row = cur.fetchone()
-	total = row["c"] if row else 0
+		clause, search_params = _user_search(q)
+		clauses.append(clause)
+		params.extend(search_params)
+	# Counting stops at USERS_COUNT_CAP rather than visiting every match
+	cur.execute(
+		f"SELECT COUNT(*) FROM (SELECT 1 FROM users {'WHERE ' + clauses[0] if clauses else ''} LIMIT ?)",
+		[*params, USERS_COUNT_CAP + 1],
+	)
+	total = cur.fetchone()[0]
+	if cursor is not None:
+		# Keyset: continue strictly after the last row of the previous page
+		clauses.append("(users.created_at, users.id) < (SELECT created_at, id FROM users WHERE id = ?)")
+		params.append(cursor)
+	where = "WHERE " + " AND ".join(clauses) if clauses else ""
 	cur.execute(
 		f"""
-		SELECT id, discord_id, username, age, gender, banned, suspended_until, created_at
+		SELECT id, discord_id, username, age, gender, banned, suspended_until, created_at,
+			(SELECT rv.roblox_user_id FROM roblox_verification rv WHERE rv.user_id = users.id) AS roblox_user_id
 		FROM users
 		{where}
-		ORDER BY created_at DESC
-		LIMIT ? OFFSET ?
+		ORDER BY created_at DESC, id DESC
+		LIMIT ?
 		""",
-		[*params, page_size, offset],
+		[*params, USERS_PAGE_SIZE + 1],
+	)
+	rows = cur.fetchall()
+	users = rows[:USERS_PAGE_SIZE]
+	next_cursor = users[-1]["id"] if len(rows) > USERS_PAGE_SIZE else None
+	avatars = get_avatar_urls(u["roblox_user_id"] for u in users)
+	return render_template(
+		"admin_users.html",
+		users=users,
+		avatars=avatars,
+		q=q,
+		cursor=cursor,
+		next_cursor=next_cursor,
+		total=min(total, USERS_COUNT_CAP),
+		total_capped=total > USERS_COUNT_CAP,
 	)
-	users = cur.fetchall()
-	conn.close()
-	pages = (total + page_size - 1) // page_size
-	return render_template("admin_users.html", users=users, q=q, page=page, pages=pages, total=total)
 
 
 @admin_bp.route("/users/<int:user_id>")
 def user_detail(user_id: int):
 	if not _is_admin():
 		return redirect(url_for("admin.login"))
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
 	user = cur.fetchone()
 	if not user:
-		conn.close()
 		flash("User not found", "error")
 		return redirect(url_for("admin.users"))
 	# Stats
-	cur.execute("SELECT COUNT(*) AS c FROM messages WHERE sender_id = ? OR receiver_id = ?", (str(user["id"]), str(user["id"])) )
+	cur.execute("SELECT COUNT(*) AS c FROM messages WHERE sender_id = ? OR receiver_id = ?", (user_id, user_id))
 	msg_count = (cur.fetchone() or {"c": 0})["c"]
-	cur.execute("SELECT COUNT(*) AS c FROM mutual_matches WHERE user1_id = ? OR user2_id = ?", (str(user["discord_id"]), str(user["discord_id"])) )
+	cur.execute("SELECT COUNT(*) AS c FROM mutual_matches WHERE user1_id = ? OR user2_id = ?", (user_id, user_id))
 	match_count = (cur.fetchone() or {"c": 0})["c"]
-	# recent matches by discord id linkage
+	# recent matches
 	cur.execute(
 		"""
 		SELECT mm.id, mm.user1_id, mm.user2_id, mm.created_at
@@ -142,10 +192,9 @@ def user_detail(user_id: int):
 		ORDER BY mm.created_at DESC
 		LIMIT 20
 		""",
-		(str(user["discord_id"]), str(user["discord_id"]))
+		(user_id, user_id)
 	)
 	matches = cur.fetchall()
-	conn.close()
 	return render_template("admin_user_detail.html", user=user, msg_count=msg_count, match_count=match_count, matches=matches)
 
 
@@ -153,11 +202,11 @@ def user_detail(user_id: int):
 def ban_user(user_id: int):
 	if not _is_admin():
 		return redirect(url_for("admin.login"))
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute("UPDATE users SET banned = TRUE, suspended_until = NULL WHERE id = ?", (user_id,))
 	conn.commit()
-	conn.close()
+	forget_user(user_id)
 	flash("User banned", "success")
 	return redirect(url_for("admin.user_detail", user_id=user_id))
 
@@ -166,11 +215,11 @@ def ban_user(user_id: int):
 def unban_user(user_id: int):
 	if not _is_admin():
 		return redirect(url_for("admin.login"))
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute("UPDATE users SET banned = FALSE WHERE id = ?", (user_id,))
 	conn.commit()
-	conn.close()
+	forget_user(user_id)
 	flash("User unbanned", "success")
 	return redirect(url_for("admin.user_detail", user_id=user_id))
 
@@ -183,11 +232,11 @@ def suspend_user(user_id: int):
 	if days <= 0:
 		flash("Provide a valid suspension duration (days)", "error")
 		return redirect(url_for("admin.user_detail", user_id=user_id))
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute("UPDATE users SET suspended_until = datetime('now', ?), banned = FALSE WHERE id = ?", (f"+{days} days", user_id))
 	conn.commit()
-	conn.close()
+	forget_user(user_id)
 	flash(f"User suspended for {days} days", "success")
 	return redirect(url_for("admin.user_detail", user_id=user_id))
 
@@ -196,11 +245,11 @@ def suspend_user(user_id: int):
 def unsuspend_user(user_id: int):
 	if not _is_admin():
 		return redirect(url_for("admin.login"))
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute("UPDATE users SET suspended_until = NULL WHERE id = ?", (user_id,))
 	conn.commit()
-	conn.close()
+	forget_user(user_id)
 	flash("User suspension cleared", "success")
 	return redirect(url_for("admin.user_detail", user_id=user_id))
 
@@ -209,16 +258,17 @@ def unsuspend_user(user_id: int):
 def delete_user(user_id: int):
 	if not _is_admin():
 		return redirect(url_for("admin.login"))
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
-	# Cascade delete related content
-	cur.execute("DELETE FROM messages WHERE sender_id = ? OR receiver_id = ?", (str(user_id), str(user_id)))
-	cur.execute("DELETE FROM matches WHERE swiper_id = ? OR swiped_id = ?", (str(user_id), str(user_id)))
-	cur.execute("DELETE FROM mutual_matches WHERE user1_id = ? OR user2_id = ?", (str(user_id), str(user_id)))
-	cur.execute("DELETE FROM users WHERE id = ?", (user_id,))
+	# Lock the account out now; its rows are removed in the background
+	cur.execute("UPDATE users SET banned = TRUE WHERE id = ?", (user_id,))
 	conn.commit()
-	conn.close()
-	flash("User deleted", "success")
+	if not cur.rowcount:
+		flash("User not found", "error")
+		return redirect(url_for("admin.users"))
+	forget_user(user_id)
+	job_id = jobs.submit(jobs.DELETE_USER, user_id)
+	flash(f"Deleting user in the background (job {job_id}: {url_for('admin.job_status', job_id=job_id)})", "success")
 	return redirect(url_for("admin.users"))
 
 
@@ -226,18 +276,17 @@ def delete_user(user_id: int):
 def delete_messages(user_id: int):
 	if not _is_admin():
 		return redirect(url_for("admin.login"))
-	peer = request.form.get("peer_id", "").strip()
+	peer = request.form.get("peer_id", type=int)
 	if not peer:
-		flash("Provide peer_id to delete conversation", "error")
+		flash("Provide a numeric peer_id to delete conversation", "error")
 		return redirect(url_for("admin.user_detail", user_id=user_id))
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute(
-		"DELETE FROM messages WHERE (sender_id = ? AND receiver_id = ?) OR (sender_id = ? AND receiver_id = ?)",
-		(str(user_id), peer, peer, str(user_id)),
+		"DELETE FROM messages WHERE MIN(sender_id, receiver_id) = ? AND MAX(sender_id, receiver_id) = ?",
+		(min(user_id, peer), max(user_id, peer)),
 	)
 	conn.commit()
-	conn.close()
 	flash("Conversation deleted", "success")
 	return redirect(url_for("admin.user_detail", user_id=user_id))
 
@@ -246,23 +295,19 @@ def delete_messages(user_id: int):
 def unmatch(user_id: int):
 	if not _is_admin():
 		return redirect(url_for("admin.login"))
-	peer_discord = request.form.get("peer_discord_id", "").strip()
-	if not peer_discord:
-		flash("Provide peer_discord_id", "error")
+	peer = request.form.get("peer_id", type=int)
+	if not peer:
+		flash("Provide a numeric peer_id", "error")
 		return redirect(url_for("admin.user_detail", user_id=user_id))
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
-	# Remove mutual match rows where either side equals user discord id or peer discord id
-	cur.execute(
-		"DELETE FROM mutual_matches WHERE (user1_id = ? AND user2_id = ?) OR (user1_id = ? AND user2_id = ?)",
-		(str(peer_discord), str(peer_discord), str(peer_discord), str(peer_discord)),
-	)
-	# Also remove any like pairs between the two users if present (by numeric user ids in matches)
+	remove_mutual_match(cur, user_id, peer)
+	# Also remove any like pairs between the two users if present
 	cur.execute(
 		"DELETE FROM matches WHERE (swiper_id = ? AND swiped_id = ?) OR (swiper_id = ? AND swiped_id = ?)",
-		(str(user_id), peer_discord, peer_discord, str(user_id)),
+		(user_id, peer, peer, user_id),
 	)
 	conn.commit()
-	conn.close()
+	forget_pair(user_id, peer)
 	flash("Unmatched users", "success")
 	return redirect(url_for("admin.user_detail", user_id=user_id))
@@ -1,21 +1,25 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from flask_login import current_user, login_required
-from .db import connect
-from .roblox import get_avatar_url
+from .db import get_db
+from .roblox import AVATAR_TTL, get_avatar_url, get_avatar_urls
+from .conditional import conditional, no_store
+from . import deck, events, quota, swipes
+from .routes_matches import MAX_MESSAGE_PAGE_SIZE, MESSAGE_PAGE_SIZE, can_message, get_conversation_page, get_inbox, mark_read
+from .routes_profile import profile_version
 
 api_bp = Blueprint("api", __name__, url_prefix="/api")
 
 
 @api_bp.get("/me")
 @login_required
+@conditional(profile_version, rotate=AVATAR_TTL)
 def me():
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute("SELECT id, username FROM users WHERE id = ?", (current_user.id,))
 	user = cur.fetchone()
-	cur.execute("SELECT roblox_user_id, roblox_username, is_verified FROM roblox_verification WHERE discord_id = ?", (str(current_user.id),))
+	cur.execute("SELECT roblox_user_id, roblox_username, is_verified FROM roblox_verification WHERE user_id = ?", (current_user.id,))
 	rv = cur.fetchone()
-	conn.close()
 	roblox = None
 	if rv:
 		avatar = get_avatar_url(int(rv["roblox_user_id"])) if rv["roblox_user_id"] else ""
@@ -29,23 +33,12 @@ def me():
 
 @api_bp.get("/swipe/next")
 @login_required
+@no_store
 def swipe_next():
-	conn = connect()
-	cur = conn.cursor()
-	cur.execute("SELECT id, username, age, gender, playstyle, server_preferences, bio FROM users WHERE id != ? ORDER BY RANDOM() LIMIT 1", (current_user.id,))
-	row = cur.fetchone()
+	row, avatar = deck.pop(current_user.id)
 	if not row:
-		conn.close()
 		return jsonify({"profile": None})
-	# get roblox for that user
-	cur.execute("SELECT roblox_user_id FROM roblox_verification WHERE discord_id = ?", (str(row["id"]),))
-	rv = cur.fetchone()
-	conn.close()
-	avatar = None
-	roblox_user_id = None
-	if rv and rv["roblox_user_id"]:
-		roblox_user_id = int(rv["roblox_user_id"])
-		avatar = get_avatar_url(roblox_user_id)
+	roblox_user_id = int(row["roblox_user_id"]) if row["roblox_user_id"] else None
 	return jsonify({
 		"profile": {
 			"id": row["id"],
@@ -59,3 +52,107 @@ def swipe_next():
 			"avatarUrl": avatar,
 		}
 	})
+
+
+@api_bp.post("/swipe/batch")
+@login_required
+def swipe_batch():
+	"""Apply queued swipes: {"swipes": [{"targetId": 2, "action": "like"}, ...]}."""
+	payload = request.get_json(silent=True)
+	items = payload.get("swipes") if isinstance(payload, dict) else payload
+	if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+		return jsonify({"error": "expected a list of {targetId, action} objects"}), 400
+	if len(items) > swipes.MAX_BATCH_SWIPES:
+		return jsonify({"error": f"at most {swipes.MAX_BATCH_SWIPES} swipes per batch"}), 400
+	decisions = [(item.get("targetId", item.get("target_id")), item.get("action")) for item in items]
+	outcomes, matched = swipes.record_swipes(current_user.id, decisions)
+	return jsonify({
+		"results": [
+			{"targetId": target_id, "action": action, "result": outcome}
+			for (target_id, action), outcome in zip(decisions, outcomes)
+		],
+		"matches": matched,
+		"remaining": quota.remaining(current_user.id),
+	})
+
+
+@api_bp.get("/messages/<int:other_id>")
+@login_required
+def messages_page(other_id: int):
+	"""Conversation history, newest page first; pass nextBefore back as ?before= for older pages."""
+	if not can_message(current_user.id, other_id):
+		return jsonify({"error": "not matched"}), 403
+	limit = min(max(request.args.get("limit", MESSAGE_PAGE_SIZE, type=int), 1), MAX_MESSAGE_PAGE_SIZE)
+	before = request.args.get("before", type=int)
+	if before is None:
+		mark_read(current_user.id, other_id)
+	rows, has_more = get_conversation_page(current_user.id, other_id, before, limit)
+	return jsonify({
+		"messages": [events.message_payload(r) for r in rows],
+		"nextBefore": rows[0]["id"] if has_more else None,
+	})
+
+
+@api_bp.post("/messages/<int:other_id>")
+@login_required
+def send_message(other_id: int):
+	if not can_message(current_user.id, other_id):
+		return jsonify({"error": "not matched"}), 403
+	content = ((request.get_json(silent=True) or {}).get("content") or "").strip()
+	if not content or len(content) > 1000:
+		return jsonify({"error": "content must be 1-1000 characters"}), 400
+	conn = get_db()
+	cur = conn.cursor()
+	cur.execute(
+		"""
+		INSERT INTO messages (sender_id, receiver_id, message_content) VALUES (?, ?, ?)
+		RETURNING id, sender_id, receiver_id, message_content, sent_at, is_read
+		""",
+		(current_user.id, other_id, content),
+	)
+	row = cur.fetchone()
+	conn.commit()
+	events.notify()
+	return jsonify({"message": events.message_payload(row)}), 201
+
+
+@api_bp.get("/messages/stream")
+@login_required
+def message_stream():
+	"""Server-sent events: "message" and "match", resumable via Last-Event-ID (or ?cursor=)."""
+	cursor = events.parse_cursor(request.headers.get("Last-Event-ID") or request.args.get("cursor"))
+	return Response(
+		events.stream(current_user.id, cursor),
+		mimetype="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+@api_bp.post("/messages/<int:other_id>/read")
+@login_required
+def read_messages(other_id: int):
+	return jsonify({"marked": mark_read(current_user.id, other_id)})
+
+
+@api_bp.get("/inbox")
+@login_required
+def inbox():
+	rows = get_inbox(current_user.id)
+	avatars = get_avatar_urls(r["roblox_user_id"] for r in rows)
+	return jsonify({
+		"conversations": [
+			{
+				"userId": r["peer_id"],
+				"username": r["username"],
+				"avatarUrl": avatars.get(r["roblox_user_id"], "") if r["roblox_user_id"] else "",
+				"lastMessage": {
+					"id": r["last_message_id"],
+					"senderId": r["last_sender_id"],
+					"content": r["last_content"],
+					"sentAt": r["last_sent_at"],
+				},
+				"unread": r["unread_count"],
+			}
+			for r in rows
+		],
+	})
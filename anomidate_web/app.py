@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from flask import Flask, render_template, redirect, url_for, request, make_response
 from flask_login import LoginManager, current_user
 from flask_cors import CORS
@@ -9,7 +10,25 @@ from .routes_swipe import swipe_bp
 from .routes_matches import matches_bp
 from .api import api_bp
 from .admin import admin_bp
-from .db import init_db, connect
+from .db import init_db, init_app as init_db_app
+from .verification import is_verified
+
+# Route policy for guard_flow: PUBLIC needs no login, UNVERIFIED needs a login
+# but not a verified Roblox account, VERIFIED is everything else
+PUBLIC, UNVERIFIED, VERIFIED = "public", "unverified", "verified"
+PUBLIC_PATHS = frozenset({"/welcome", "/health", "/auth/login", "/auth/register", "/auth/forgot", "/auth/reset", "/admin/login"})
+# /admin enforces its own session check in admin.protect_admin
+PUBLIC_PREFIXES = ("/static/", "/api/", "/admin")
+UNVERIFIED_PATHS = frozenset({"/profile/verify", "/profile/verify/", "/profile/roblox/login", "/profile/roblox/callback", "/auth/logout"})
+
+
+@lru_cache(maxsize=4096)
+def route_policy(path: str) -> str:
+	if path in PUBLIC_PATHS or path.startswith(PUBLIC_PREFIXES):
+		return PUBLIC
+	if path in UNVERIFIED_PATHS:
+		return UNVERIFIED
+	return VERIFIED
 
 
 def create_app():
@@ -25,6 +44,7 @@ def create_app():
 
 	# DB
 	init_db()
+	init_db_app(app)
 
 	# Auth
 	app.register_blueprint(auth_bp)
@@ -47,23 +67,14 @@ def create_app():
 
 	@app.before_request
 	def guard_flow():
-		path = request.path
-		public = {"/welcome", "/health", "/auth/login", "/auth/register", "/auth/forgot", "/auth/reset", "/admin/login"}
-		if any(path == p or path.startswith("/static/") or path.startswith("/api/") for p in public):
-			return None
-		if path.startswith("/admin"):
+		policy = route_policy(request.path)
+		if policy == PUBLIC:
 			return None
 		if not current_user.is_authenticated:
 			return redirect(url_for("welcome"))
-		conn = connect()
-		cur = conn.cursor()
-		# Force Roblox verification before any in-app route (except verify page)
-		cur.execute("SELECT roblox_user_id, is_verified FROM roblox_verification WHERE discord_id = ?", (str(current_user.id),))
-		row = cur.fetchone()
-		conn.close()
-		if not row or not bool(row["is_verified"]):
-			if path not in ("/profile/verify", "/profile/verify", "/profile/verify/"):
-				return redirect(url_for("profile.verify_roblox"))
+		# Force Roblox verification before any in-app route (except the verify flow)
+		if policy == VERIFIED and not is_verified(current_user.id):
+			return redirect(url_for("profile.verify_roblox"))
 		return None
 
 	@app.route("/")
@@ -7,33 +7,77 @@ from email.message import EmailMessage
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask import current_app
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_login import LoginManager, login_user, logout_user, login_required, UserMixin
+from flask_login import LoginManager, login_user, logout_user, login_required
 
-from .db import connect
+from .cache import TTLCache
+from .db import get_db
+from . import http_client, verification
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 login_manager = LoginManager()
 login_manager.login_view = "auth.login"
 
-class WebUser(UserMixin):
+# Loaded users; a ban or suspension can take USER_CACHE_TTL seconds to reach other workers
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+USER_COLUMNS = "id, discord_id, username, banned, suspended_until"
+_users = TTLCache(maxsize=8192, ttl=USER_CACHE_TTL)
+
+
+class WebUser:
+	__slots__ = ("id", "discord_id", "username", "banned", "suspended_until")
+	is_authenticated = True
+	is_anonymous = False
+
 	def __init__(self, user_row):
 		self.id = user_row["id"]
 		self.discord_id = user_row["discord_id"]
 		self.username = user_row["username"]
-		self.password_hash = user_row["password_hash"]
+		self.banned = bool(user_row["banned"])
+		self.suspended_until = user_row["suspended_until"]
+
+	@property
+	def is_suspended(self) -> bool:
+		# suspended_until is stored as a UTC "YYYY-MM-DD HH:MM:SS" string, so it compares as text
+		return bool(self.suspended_until) and self.suspended_until > datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+	@property
+	def is_active(self) -> bool:
+		return not (self.banned or self.is_suspended)
+
+	def get_id(self) -> str:
+		return str(self.id)
 
 	@staticmethod
 	def get_by_id(user_id: int):
-		conn = connect()
-		cur = conn.cursor()
-		cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-		row = cur.fetchone()
-		conn.close()
-		return WebUser(row) if row else None
+		user = _users.get(user_id)
+		if user is None:
+			cur = get_db().cursor()
+			cur.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id = ?", (user_id,))
+			row = cur.fetchone()
+			if row is None:
+				return None
+			user = WebUser(row)
+			_users.set(user_id, user)
+		return user
+
+
+def forget_user(user_id: int = None):
+	"""Drop one cached WebUser, or all of them when user_id is None."""
+	if user_id is None:
+		_users.clear()
+	else:
+		_users.pop(user_id)
+
+
+def user_cache_stats() -> dict:
+	return _users.stats()
+
 
 @login_manager.user_loader
 def load_user(user_id):
-	return WebUser.get_by_id(int(user_id))
+	# Banned and suspended users load as anonymous, which every login check already handles
+	user = WebUser.get_by_id(int(user_id))
+	return user if user is not None and user.is_active else None
 
 
 def _send_email(to_email: str, subject: str, body: str) -> bool:
@@ -72,17 +116,14 @@ def register():
 		if not username or not password:
 			flash("Username and password are required", "error")
 			return redirect(url_for("auth.register"))
-		conn = connect()
+		conn = get_db()
 		cur = conn.cursor()
-		try:
-			cur.execute(
-				"INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)",
-				(username, generate_password_hash(password), email),
-			)
-			conn.commit()
-			user_id = cur.lastrowid
-		finally:
-			conn.close()
+		cur.execute(
+			"INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)",
+			(username, generate_password_hash(password), email),
+		)
+		conn.commit()
+		user_id = cur.lastrowid
 		flash("Account created. Please log in.", "success")
 		return redirect(url_for("auth.login"))
 	return render_template("auth_register.html")
@@ -96,20 +137,19 @@ def login():
 		if not username or not password:
 			flash("Please enter username and password", "error")
 			return redirect(url_for("auth.login"))
-		conn = connect()
+		conn = get_db()
 		cur = conn.cursor()
 		cur.execute("SELECT * FROM users WHERE username = ?", (username,))
 		row = cur.fetchone()
 		if row and row["password_hash"] and check_password_hash(row["password_hash"], password):
-			login_user(WebUser(row))
-			# Force Roblox verification on onboarding after login
-			cur.execute("SELECT is_verified FROM roblox_verification WHERE discord_id = ?", (str(row["id"]),))
-			rv = cur.fetchone()
-			conn.close()
-			if not rv or not bool(rv["is_verified"]):
+			if not login_user(WebUser(row)):
+				flash("This account is banned or suspended", "error")
+				return redirect(url_for("auth.login"))
+			# Force Roblox verification on onboarding after login; re-read it fresh here
+			verification.invalidate(row["id"])
+			if not verification.is_verified(row["id"]):
 				return redirect(url_for("profile.verify_roblox"))
 			return redirect(url_for("index"))
-		conn.close()
 		flash("Invalid username or password", "error")
 		return redirect(url_for("auth.login"))
 	return render_template("auth_login.html")
@@ -124,11 +164,10 @@ def forgot_password():
 			return redirect(url_for("auth.forgot_password"))
 		code = secrets.token_urlsafe(6)
 		expires = datetime.utcnow() + timedelta(minutes=15)
-		conn = connect()
+		conn = get_db()
 		cur = conn.cursor()
 		cur.execute("INSERT INTO password_resets (email, code, expires_at) VALUES (?, ?, ?)", (email, code, expires))
 		conn.commit()
-		conn.close()
 		sent = _send_email(email, "AnomiDate Password Reset", f"Your reset code is: {code}\nThis code expires in 15 minutes.")
 		if sent:
 			flash("Reset code sent to your email", "success")
@@ -147,7 +186,7 @@ def reset_password():
 		if not (email and code and new_password):
 			flash("All fields are required", "error")
 			return redirect(url_for("auth.reset_password"))
-		conn = connect()
+		conn = get_db()
 		cur = conn.cursor()
 		cur.execute(
 			"SELECT id, expires_at, used FROM password_resets WHERE email = ? AND code = ? ORDER BY created_at DESC LIMIT 1",
@@ -155,19 +194,15 @@ def reset_password():
 		)
 		row = cur.fetchone()
 		if not row:
-			conn.close()
 			flash("Invalid code", "error")
 			return redirect(url_for("auth.reset_password"))
-		try:
-			used = bool(row["used"])
-			if used:
-				flash("Code already used", "error")
-				return redirect(url_for("auth.reset_password"))
-			cur.execute("UPDATE users SET password_hash = ? WHERE email = ?", (generate_password_hash(new_password), email))
-			cur.execute("UPDATE password_resets SET used = TRUE WHERE id = ?", (row["id"],))
-			conn.commit()
-		finally:
-			conn.close()
+		used = bool(row["used"])
+		if used:
+			flash("Code already used", "error")
+			return redirect(url_for("auth.reset_password"))
+		cur.execute("UPDATE users SET password_hash = ? WHERE email = ?", (generate_password_hash(new_password), email))
+		cur.execute("UPDATE password_resets SET used = TRUE WHERE id = ?", (row["id"],))
+		conn.commit()
 		flash("Password has been reset. You can now log in.", "success")
 		return redirect(url_for("auth.login"))
 	return render_template("auth_reset.html")
@@ -200,7 +235,6 @@ def discord_callback():
 	if not code:
 		flash("Discord login failed: missing code", "error")
 		return redirect(url_for("auth.login"))
-	import requests
 	data = {
 		"client_id": DISCORD_CLIENT_ID,
 		"client_secret": DISCORD_CLIENT_SECRET,
@@ -209,7 +243,7 @@ def discord_callback():
 		"redirect_uri": DISCORD_REDIRECT_URI,
 	}
 	headers = {"Content-Type": "application/x-www-form-urlencoded"}
-	tr = requests.post(DISCORD_TOKEN_URL, data=data, headers=headers, timeout=15)
+	tr = http_client.post(DISCORD_TOKEN_URL, data=data, headers=headers, endpoint="discord.oauth_token")
 	if tr.status_code != 200:
 		flash("Discord token exchange failed", "error")
 		return redirect(url_for("auth.login"))
@@ -218,14 +252,14 @@ def discord_callback():
 	if not access_token:
 		flash("Discord token missing", "error")
 		return redirect(url_for("auth.login"))
-	ur = requests.get(DISCORD_USER_URL, headers={"Authorization": f"Bearer {access_token}"}, timeout=15)
+	ur = http_client.get(DISCORD_USER_URL, headers={"Authorization": f"Bearer {access_token}"}, endpoint="discord.user")
 	if ur.status_code != 200:
 		flash("Failed to fetch Discord user", "error")
 		return redirect(url_for("auth.login"))
 	ud = ur.json()
 	discord_id = str(ud.get("id"))
 	username = ud.get("username") or f"user_{discord_id}"
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute("SELECT * FROM users WHERE discord_id = ?", (discord_id,))
 	row = cur.fetchone()
@@ -237,11 +271,12 @@ def discord_callback():
 		conn.commit()
 		cur.execute("SELECT * FROM users WHERE discord_id = ?", (discord_id,))
 		row = cur.fetchone()
-	conn.close()
 	if not row:
 		flash("Login failed", "error")
 		return redirect(url_for("auth.login"))
-	login_user(WebUser(row))
+	if not login_user(WebUser(row)):
+		flash("This account is banned or suspended", "error")
+		return redirect(url_for("auth.login"))
 	flash("Logged in with Discord", "success")
 	return redirect(url_for("index"))
 
@@ -0,0 +1,112 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+	"""Thread-safe LRU with a per-entry time-to-live and hit/miss counters.
+
+	Each worker process has its own copy. Code that writes the underlying rows
+	invalidates the entry in its own process; other workers keep serving their
+	copy until it expires, so the TTL bounds how stale a read can be.
+	"""
+
+	def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self.hits = 0
+		self.misses = 0
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key, default=None):
+		with self._lock:
+			item = self._data.get(key, _MISSING)
+			if item is not _MISSING:
+				value, expires = item
+				if expires > time.monotonic():
+					self._data.move_to_end(key)
+					self.hits += 1
+					return value
+				del self._data[key]
+			self.misses += 1
+			return default
+
+	def set(self, key, value, ttl: float = None):
+		expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+		with self._lock:
+			self._data[key] = (value, expires)
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def pop(self, key, default=None):
+		with self._lock:
+			item = self._data.pop(key, _MISSING)
+		return default if item is _MISSING else item[0]
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+# Long-lived background threads by name: (thread, pid that started it)
+_threads = {}
+_threads_lock = threading.Lock()
+
+
+def ensure_thread(name: str, target):
+	"""Make sure this process runs target() in a daemon thread called name.
+
+	Threads are started lazily on first use, so each gunicorn worker starts its
+	own after the fork instead of inheriting a dead one from the master, and a
+	thread that died is started again.
+	"""
+	pid = os.getpid()
+	entry = _threads.get(name)
+	if entry is not None and entry[1] == pid and entry[0].is_alive():
+		return
+	with _threads_lock:
+		entry = _threads.get(name)
+		if entry is None or entry[1] != pid or not entry[0].is_alive():
+			thread = threading.Thread(target=target, name=name, daemon=True)
+			_threads[name] = (thread, pid)
+			thread.start()
+
+
+# Refresh-ahead work, run by BACKGROUND_THREADS threads per process
+BACKGROUND_THREADS = 2
+_background = queue.Queue()
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+
+def submit_background(key, fn, *args):
+	"""Run fn(*args) in the background unless work for key is already queued."""
+	with _inflight_lock:
+		if key in _inflight:
+			return
+		_inflight.add(key)
+	for i in range(BACKGROUND_THREADS):
+		ensure_thread(f"cache-refresh-{i}", _background_loop)
+	_background.put((key, fn, args))
+
+
+def _background_loop():
+	while True:
+		key, fn, args = _background.get()
+		try:
+			fn(*args)
+		except Exception as e:
+			print("Background refresh failed:", e)
+		finally:
+			with _inflight_lock:
+				_inflight.discard(key)
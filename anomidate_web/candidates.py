@@ -0,0 +1,106 @@
+import random
+from .db import get_db
+
+# Everything a swipe card needs, in one row
+CANDIDATE_COLUMNS = """
+	u.id, u.username, u.age, u.gender, u.bio, u.playstyle, u.server_preferences,
+	(SELECT rv.roblox_user_id FROM roblox_verification rv WHERE rv.user_id = u.id) AS roblox_user_id
+"""
+
+
+FILTER_KEYS = ("age_min", "age_max", "gender", "playstyle")
+
+# Random-seek tuning: bounded probes before the unbounded fallback walk
+SEEK_ATTEMPTS = 4
+SEEK_WINDOW = 64
+
+
+def parse_filters(args) -> dict:
+	"""Pull the swipe filters out of a request.args-like mapping."""
+	filters = {
+		"age_min": args.get("age_min", type=int),
+		"age_max": args.get("age_max", type=int),
+		"gender": (args.get("gender") or "").strip() or None,
+		"playstyle": (args.get("playstyle") or "").strip() or None,
+	}
+	return {k: v for k, v in filters.items() if v is not None}
+
+
+def _where(viewer_id: int, filters: dict):
+	# Every predicate is either on the users row itself or a unique-index probe
+	clauses = [
+		"u.id != ?",
+		"COALESCE(u.banned, 0) = 0",
+		"(u.suspended_until IS NULL OR u.suspended_until <= CURRENT_TIMESTAMP)",
+		"EXISTS (SELECT 1 FROM roblox_verification rv WHERE rv.user_id = u.id AND rv.is_verified)",
+		"NOT EXISTS (SELECT 1 FROM matches m WHERE m.swiper_id = ? AND m.swiped_id = u.id)",
+	]
+	params = [viewer_id, viewer_id]
+	if filters.get("age_min") is not None:
+		clauses.append("COALESCE(u.age, 0) >= ?")
+		params.append(filters["age_min"])
+	if filters.get("age_max") is not None:
+		clauses.append("COALESCE(u.age, 0) <= ?")
+		params.append(filters["age_max"])
+	if filters.get("gender"):
+		clauses.append("u.gender = ? COLLATE NOCASE")
+		params.append(filters["gender"])
+	if filters.get("playstyle"):
+		clauses.append("u.playstyle = ? COLLATE NOCASE")
+		params.append(filters["playstyle"])
+	return " AND ".join(clauses), params
+
+
+def eligible_profile(viewer_id: int, candidate_id: int):
+	"""Re-check one known candidate by primary key; None if no longer eligible."""
+	where, params = _where(viewer_id, {})
+	cur = get_db().cursor()
+	cur.execute(f"SELECT {CANDIDATE_COLUMNS} FROM users u WHERE {where} AND u.id = ?", [*params, candidate_id])
+	return cur.fetchone()
+
+
+def pick_candidate(viewer_id: int, filters: dict = None, exclude=()):
+	"""Return one random eligible profile for viewer_id, or None.
+
+	Seeks to a few random rowids and probes a bounded window of ids after
+	each, which costs O(log n) per attempt no matter how many users the
+	viewer has already swiped. Only if every probe lands in an exhausted
+	region does it fall back to walking forward from the last pivot (and
+	wrapping below it), so an existing candidate is always found.
+	"""
+	cur = get_db().cursor()
+	# Two scalar subqueries: a combined MIN(), MAX() would scan the whole table
+	cur.execute("SELECT (SELECT MIN(id) FROM users), (SELECT MAX(id) FROM users)")
+	lo, hi = cur.fetchone()
+	if lo is None:
+		return None
+	where, params = _where(viewer_id, filters or {})
+	if exclude:
+		where += " AND u.id NOT IN (%s)" % ",".join("?" * len(exclude))
+		params.extend(exclude)
+	select = f"SELECT {CANDIDATE_COLUMNS} FROM users u WHERE {where}"
+	for _ in range(SEEK_ATTEMPTS):
+		pivot = random.randint(lo, hi)
+		cur.execute(f"{select} AND u.id >= ? AND u.id < ? ORDER BY u.id LIMIT 1", [*params, pivot, pivot + SEEK_WINDOW])
+		row = cur.fetchone()
+		if row:
+			return row
+	for seek, order in (("u.id >= ?", "ASC"), ("u.id < ?", "DESC")):
+		cur.execute(f"{select} AND {seek} ORDER BY u.id {order} LIMIT 1", [*params, pivot])
+		row = cur.fetchone()
+		if row:
+			return row
+	return None
+
+
+def pick_candidates(viewer_id: int, filters: dict = None, count: int = 1, exclude=()):
+	"""Up to count distinct candidates, each drawn with pick_candidate()."""
+	picked = []
+	seen = list(exclude)
+	for _ in range(count):
+		row = pick_candidate(viewer_id, filters, exclude=seen)
+		if row is None:
+			break
+		picked.append(row)
+		seen.append(row["id"])
+	return picked
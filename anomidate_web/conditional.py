@@ -0,0 +1,61 @@
+import hashlib
+import os
+import time
+from functools import wraps
+from pathlib import Path
+from flask import make_response, request, session
+from flask_login import current_user
+
+# Part of every ETag so a deploy (new code or templates) never revalidates an old page.
+# The same across workers since they share the files; override with ETAG_SALT.
+_RELEASE = os.getenv("ETAG_SALT") or str(max(
+	p.stat().st_mtime_ns for p in Path(__file__).parent.rglob("*") if p.suffix in (".py", ".html")
+))
+
+
+def _private(resp):
+	# Per-user responses: browsers may keep them but must revalidate, shared caches must not
+	resp.cache_control.private = True
+	resp.cache_control.no_cache = True
+	resp.vary.add("Cookie")
+	return resp
+
+
+def conditional(version, rotate: float = None):
+	"""Serve GETs of the wrapped view with an ETag and answer If-None-Match with 304.
+
+	version(user_id) is a cheap read (a few indexed rows) whose result changes
+	whenever the view's output would; the view itself only runs on a miss.
+	rotate forces a new ETag every `rotate` seconds for parts that are not
+	versioned in the database, such as Roblox avatar URLs.
+	"""
+	def decorator(view):
+		@wraps(view)
+		def wrapper(*args, **kwargs):
+			# A pending flash message is part of the page, so render it fresh
+			if request.method not in ("GET", "HEAD") or "_flashes" in session:
+				return _private(make_response(view(*args, **kwargs)))
+			epoch = int(time.time() // rotate) if rotate else None
+			key = repr((_RELEASE, request.full_path, current_user.id, epoch, version(current_user.id)))
+			tag = hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+			if request.if_none_match.contains_weak(tag):
+				resp = make_response("", 304)
+			else:
+				resp = make_response(view(*args, **kwargs))
+				if resp.status_code != 200:
+					return _private(resp)
+			resp.set_etag(tag, weak=True)
+			return _private(resp)
+		return wrapper
+	return decorator
+
+
+def no_store(view):
+	"""For reads with side effects (e.g. popping the swipe deck): never cached or revalidated."""
+	@wraps(view)
+	def wrapper(*args, **kwargs):
+		resp = make_response(view(*args, **kwargs))
+		resp.cache_control.no_store = True
+		resp.cache_control.private = True
+		return resp
+	return wrapper
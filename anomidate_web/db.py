@@ -1,13 +1,29 @@
+import atexit
+import os
 import sqlite3
+import threading
+import weakref
 from pathlib import Path
 
-DB_PATH = Path("anomic_dating.db")
+DB_PATH = Path(os.getenv("ANOMIDATE_DB", "anomic_dating.db"))
 
+# Applied to every connection once, right after it is opened
+CONNECTION_PRAGMAS = (
+	("busy_timeout", 5000),
+	("synchronous", "NORMAL"),
+	("cache_size", -16000),  # KiB, i.e. 16 MB page cache
+	("mmap_size", 134217728),
+	("temp_store", "MEMORY"),
+	("foreign_keys", "ON"),
+)
+# Seconds migrate() waits for the write lock. Workers booting while another one
+# migrates must queue behind it (which can take minutes on a large file), not
+# give up after the normal busy_timeout and fail to boot.
+MIGRATION_LOCK_TIMEOUT = int(os.getenv("MIGRATION_LOCK_TIMEOUT", "3600"))
 
-SCHEMA_SQL = """
-PRAGMA journal_mode=WAL;
-PRAGMA busy_timeout=5000;
 
+# Original schema, applied by migration 1. Later shape changes live in MIGRATIONS.
+SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS users (
 	id INTEGER PRIMARY KEY AUTOINCREMENT,
 	discord_id TEXT UNIQUE,
@@ -70,32 +86,95 @@ CREATE TABLE IF NOT EXISTS messages (
 
 
 def connect():
-	conn = sqlite3.connect(DB_PATH)
+	"""Open a new, fully configured connection. Prefer get_db() in request code."""
+	conn = sqlite3.connect(DB_PATH, timeout=5.0, check_same_thread=False)
 	conn.row_factory = sqlite3.Row
+	for name, value in CONNECTION_PRAGMAS:
+		conn.execute(f"PRAGMA {name}={value}")
 	return conn
 
 
-def _migrate(conn: sqlite3.Connection):
-	cur = conn.cursor()
-	# Add users.email if missing
-	cur.execute("PRAGMA table_info(users)")
-	cols = [r[1] for r in cur.fetchall()]
+class _PooledConnection:
+	"""Holds one thread's connection; dropping it (thread exit) closes the handle."""
+
+	__slots__ = ("conn", "__weakref__")
+
+	def __init__(self, conn):
+		self.conn = conn
+
+	def close(self):
+		if self.conn is not None:
+			self.conn.close()
+			self.conn = None
+
+
+_local = threading.local()
+_pool = weakref.WeakSet()
+_pool_lock = threading.Lock()
+
+
+def get_db() -> sqlite3.Connection:
+	"""Return the connection reused by the current thread, opening it on first use."""
+	holder = getattr(_local, "holder", None)
+	if holder is None or holder.conn is None:
+		holder = _PooledConnection(connect())
+		_local.holder = holder
+		with _pool_lock:
+			_pool.add(holder)
+	return holder.conn
+
+
+def release_db(exc=None):
+	"""End-of-request hook: roll back anything left uncommitted, keep the connection."""
+	holder = getattr(_local, "holder", None)
+	if holder is not None and holder.conn is not None and holder.conn.in_transaction:
+		holder.conn.rollback()
+
+
+def close_all():
+	with _pool_lock:
+		holders = list(_pool)
+		_pool.clear()
+	for holder in holders:
+		try:
+			holder.close()
+		except sqlite3.Error:
+			pass
+
+
+def init_app(app):
+	app.teardown_appcontext(release_db)
+	atexit.register(close_all)
+
+
+def _columns(conn: sqlite3.Connection, table: str):
+	return {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _execute_script(conn: sqlite3.Connection, script: str):
+	# executescript() would COMMIT first; run statement by statement so the
+	# migration stays inside the caller's transaction.
+	buf = ""
+	for line in script.splitlines(keepends=True):
+		buf += line
+		if sqlite3.complete_statement(buf):
+			conn.execute(buf)
+			buf = ""
+	if buf.strip():
+		conn.execute(buf)
+
+
+def _m001_baseline(conn: sqlite3.Connection):
+	# Brings both fresh files and pre-versioning databases to the same shape
+	_execute_script(conn, SCHEMA_SQL)
+	cols = _columns(conn, "users")
 	if "email" not in cols:
-		cur.execute("ALTER TABLE users ADD COLUMN email TEXT")
-		conn.commit()
-	# Add moderation columns if missing
-	cur.execute("PRAGMA table_info(users)")
-	cols = [r[1] for r in cur.fetchall()]
+		conn.execute("ALTER TABLE users ADD COLUMN email TEXT")
 	if "banned" not in cols:
-		cur.execute("ALTER TABLE users ADD COLUMN banned BOOLEAN DEFAULT FALSE")
-		conn.commit()
-	cur.execute("PRAGMA table_info(users)")
-	cols = [r[1] for r in cur.fetchall()]
+		conn.execute("ALTER TABLE users ADD COLUMN banned BOOLEAN DEFAULT FALSE")
 	if "suspended_until" not in cols:
-		cur.execute("ALTER TABLE users ADD COLUMN suspended_until DATETIME")
-		conn.commit()
-	# Password reset table
-	cur.execute(
+		conn.execute("ALTER TABLE users ADD COLUMN suspended_until DATETIME")
+	conn.execute(
 		"""
 		CREATE TABLE IF NOT EXISTS password_resets (
 			id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -107,38 +186,550 @@ def _migrate(conn: sqlite3.Connection):
 		)
 		"""
 	)
-	conn.commit()
-	# Roblox verification: add numeric user_id and backfill from discord_id if numeric
-	cur.execute("PRAGMA table_info(roblox_verification)")
-	cols = [r[1] for r in cur.fetchall()]
-	if "user_id" not in cols:
-		cur.execute("ALTER TABLE roblox_verification ADD COLUMN user_id INTEGER")
-		conn.commit()
-		cur.execute("UPDATE roblox_verification SET user_id = CAST(discord_id AS INTEGER) WHERE user_id IS NULL AND discord_id GLOB '[0-9]*'")
-		conn.commit()
-	# Mutual matches: add numeric columns and backfill from existing text ids if numeric
-	cur.execute("PRAGMA table_info(mutual_matches)")
-	cols = [r[1] for r in cur.fetchall()]
+	# Roblox verification: numeric user_id backfilled from discord_id if numeric
+	if "user_id" not in _columns(conn, "roblox_verification"):
+		conn.execute("ALTER TABLE roblox_verification ADD COLUMN user_id INTEGER")
+	conn.execute("UPDATE roblox_verification SET user_id = CAST(discord_id AS INTEGER) WHERE user_id IS NULL AND discord_id GLOB '[0-9]*'")
+	# Mutual matches: numeric columns backfilled from existing text ids if numeric
+	cols = _columns(conn, "mutual_matches")
 	if "user1_user_id" not in cols:
-		cur.execute("ALTER TABLE mutual_matches ADD COLUMN user1_user_id INTEGER")
-		conn.commit()
+		conn.execute("ALTER TABLE mutual_matches ADD COLUMN user1_user_id INTEGER")
 	if "user2_user_id" not in cols:
-		cur.execute("ALTER TABLE mutual_matches ADD COLUMN user2_user_id INTEGER")
+		conn.execute("ALTER TABLE mutual_matches ADD COLUMN user2_user_id INTEGER")
+	conn.execute("UPDATE mutual_matches SET user1_user_id = CAST(user1_id AS INTEGER) WHERE user1_user_id IS NULL AND user1_id GLOB '[0-9]*'")
+	conn.execute("UPDATE mutual_matches SET user2_user_id = CAST(user2_id AS INTEGER) WHERE user2_user_id IS NULL AND user2_id GLOB '[0-9]*'")
+
+
+INTEGER_USER_IDS_SQL = """
+CREATE TABLE matches_new (
+	id INTEGER PRIMARY KEY AUTOINCREMENT,
+	swiper_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	swiped_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	action TEXT NOT NULL CHECK (action IN ('like','pass')),
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+	UNIQUE(swiper_id, swiped_id)
+);
+INSERT INTO matches_new (id, swiper_id, swiped_id, action, created_at)
+SELECT m.id, CAST(m.swiper_id AS INTEGER), CAST(m.swiped_id AS INTEGER), m.action, m.created_at
+FROM matches m
+WHERE CAST(m.swiper_id AS INTEGER) IN (SELECT id FROM users)
+AND CAST(m.swiped_id AS INTEGER) IN (SELECT id FROM users);
+DROP TABLE matches;
+ALTER TABLE matches_new RENAME TO matches;
+-- (swiper, swiped) is served by the UNIQUE index; these cover the by-action scans
+CREATE INDEX idx_matches_swiper_action ON matches(swiper_id, action, swiped_id);
+CREATE INDEX idx_matches_swiped_action ON matches(swiped_id, action, swiper_id);
+
+CREATE TABLE messages_new (
+	id INTEGER PRIMARY KEY AUTOINCREMENT,
+	sender_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	receiver_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	message_content TEXT NOT NULL,
+	sent_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+	is_read BOOLEAN DEFAULT FALSE
+);
+INSERT INTO messages_new (id, sender_id, receiver_id, message_content, sent_at, is_read)
+SELECT m.id, CAST(m.sender_id AS INTEGER), CAST(m.receiver_id AS INTEGER), m.message_content, m.sent_at, m.is_read
+FROM messages m
+WHERE CAST(m.sender_id AS INTEGER) IN (SELECT id FROM users)
+AND CAST(m.receiver_id AS INTEGER) IN (SELECT id FROM users);
+DROP TABLE messages;
+ALTER TABLE messages_new RENAME TO messages;
+CREATE INDEX idx_messages_pair_time ON messages(sender_id, receiver_id, sent_at);
+
+-- The primary key is the (user, date) quota lookup, so the table is its own covering index
+CREATE TABLE daily_swipes_new (
+	user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	swipe_date DATE NOT NULL,
+	swipe_count INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY (user_id, swipe_date)
+) WITHOUT ROWID;
+INSERT INTO daily_swipes_new (user_id, swipe_date, swipe_count)
+SELECT CAST(d.user_id AS INTEGER), d.swipe_date, SUM(d.swipe_count)
+FROM daily_swipes d
+WHERE CAST(d.user_id AS INTEGER) IN (SELECT id FROM users)
+GROUP BY 1, 2;
+DROP TABLE daily_swipes;
+ALTER TABLE daily_swipes_new RENAME TO daily_swipes;
+
+-- Pairs are stored canonically as (low, high) user ids
+CREATE TABLE mutual_matches_new (
+	id INTEGER PRIMARY KEY AUTOINCREMENT,
+	user1_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	user2_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+	CHECK (user1_id < user2_id),
+	UNIQUE(user1_id, user2_id)
+);
+INSERT OR IGNORE INTO mutual_matches_new (user1_id, user2_id, created_at)
+SELECT MIN(a, b), MAX(a, b), created_at
+FROM (
+	SELECT COALESCE(user1_user_id, CAST(user1_id AS INTEGER)) AS a, COALESCE(user2_user_id, CAST(user2_id AS INTEGER)) AS b, created_at
+	FROM mutual_matches
+)
+WHERE a != b AND a IN (SELECT id FROM users) AND b IN (SELECT id FROM users)
+ORDER BY created_at;
+DROP TABLE mutual_matches;
+ALTER TABLE mutual_matches_new RENAME TO mutual_matches;
+CREATE INDEX idx_mutual_matches_user2 ON mutual_matches(user2_id, user1_id);
+
+-- discord_id is kept as the legacy upsert key; user_id is the integer path
+CREATE TABLE roblox_verification_new (
+	id INTEGER PRIMARY KEY AUTOINCREMENT,
+	discord_id TEXT UNIQUE NOT NULL,
+	user_id INTEGER UNIQUE REFERENCES users(id) ON DELETE CASCADE,
+	roblox_username TEXT NOT NULL,
+	roblox_user_id INTEGER NOT NULL,
+	verified_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+	is_verified BOOLEAN DEFAULT FALSE
+);
+INSERT INTO roblox_verification_new (id, discord_id, user_id, roblox_username, roblox_user_id, verified_at, is_verified)
+SELECT r.id, r.discord_id, u.id, r.roblox_username, r.roblox_user_id, r.verified_at, r.is_verified
+FROM roblox_verification r
+LEFT JOIN users u ON u.id = COALESCE(r.user_id, CAST(r.discord_id AS INTEGER));
+DROP TABLE roblox_verification;
+ALTER TABLE roblox_verification_new RENAME TO roblox_verification;
+"""
+
+
+def _m002_integer_user_ids(conn: sqlite3.Connection):
+	_execute_script(conn, INTEGER_USER_IDS_SQL)
+
+
+SWIPE_DECKS_SQL = """
+CREATE TABLE swipe_decks (
+	user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	position INTEGER NOT NULL,
+	candidate_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	roblox_user_id INTEGER,
+	avatar_url TEXT,
+	PRIMARY KEY (user_id, position)
+) WITHOUT ROWID;
+CREATE INDEX idx_swipe_decks_candidate ON swipe_decks(candidate_id);
+
+CREATE TABLE swipe_deck_state (
+	user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+	filters TEXT NOT NULL DEFAULT '{}',
+	next_position INTEGER NOT NULL DEFAULT 0,
+	refilled_at DATETIME
+);
+"""
+
+
+def _m004_swipe_decks(conn: sqlite3.Connection):
+	_execute_script(conn, SWIPE_DECKS_SQL)
+
+
+AVATAR_CACHE_SQL = """
+-- image_url is '' for a cached "no image"; fetched_at is unix time
+CREATE TABLE avatar_cache (
+	roblox_user_id INTEGER NOT NULL,
+	size TEXT NOT NULL,
+	circular INTEGER NOT NULL,
+	image_url TEXT NOT NULL,
+	fetched_at REAL NOT NULL,
+	PRIMARY KEY (roblox_user_id, size, circular)
+) WITHOUT ROWID;
+"""
+
+
+def _m005_avatar_cache(conn: sqlite3.Connection):
+	_execute_script(conn, AVATAR_CACHE_SQL)
+
+
+MESSAGE_PAIR_INDEX_SQL = """
+-- Conversations are read per unordered pair, newest id first (keyset pagination)
+CREATE INDEX idx_messages_conversation ON messages(MIN(sender_id, receiver_id), MAX(sender_id, receiver_id), id);
+"""
+
+
+def _m006_message_pair_index(conn: sqlite3.Connection):
+	_execute_script(conn, MESSAGE_PAIR_INDEX_SQL)
+
+
+MESSAGE_RECEIVER_INDEX_SQL = """
+-- Live-event catch-up reads a user's messages after a cursor id (receiver side; see migration 13 for the sender side)
+CREATE INDEX idx_messages_receiver ON messages(receiver_id, id);
+"""
+
+
+def _m007_message_receiver_index(conn: sqlite3.Connection):
+	_execute_script(conn, MESSAGE_RECEIVER_INDEX_SQL)
+
+
+CONVERSATION_SUMMARIES_SQL = """
+-- One row per (user, peer) with messages between them, kept current by triggers on messages.
+-- unread_count counts the peer's messages to user_id that are not read yet.
+CREATE TABLE conversation_summaries (
+	user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	peer_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	last_message_id INTEGER,
+	last_sender_id INTEGER,
+	last_content TEXT,
+	last_sent_at DATETIME,
+	unread_count INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY (user_id, peer_id)
+) WITHOUT ROWID;
+CREATE INDEX idx_conversation_summaries_recent ON conversation_summaries(user_id, last_message_id);
+
+INSERT INTO conversation_summaries (user_id, peer_id, last_message_id, last_sender_id, last_content, last_sent_at, unread_count)
+SELECT s.user_id, s.peer_id, m.id, m.sender_id, m.message_content, m.sent_at, s.unread_count
+FROM (
+	SELECT user_id, peer_id, MAX(id) AS last_id, SUM(unread) AS unread_count FROM (
+		SELECT sender_id AS user_id, receiver_id AS peer_id, id, 0 AS unread FROM messages
+		UNION ALL
+		SELECT receiver_id, sender_id, id, NOT COALESCE(is_read, 0) FROM messages
+	)
+	GROUP BY user_id, peer_id
+) s
+JOIN messages m ON m.id = s.last_id;
+
+CREATE TRIGGER trg_messages_summary_insert AFTER INSERT ON messages
+BEGIN
+	INSERT INTO conversation_summaries (user_id, peer_id, last_message_id, last_sender_id, last_content, last_sent_at, unread_count)
+	VALUES
+		(NEW.sender_id, NEW.receiver_id, NEW.id, NEW.sender_id, NEW.message_content, NEW.sent_at, 0),
+		(NEW.receiver_id, NEW.sender_id, NEW.id, NEW.sender_id, NEW.message_content, NEW.sent_at, NOT COALESCE(NEW.is_read, 0))
+	ON CONFLICT(user_id, peer_id) DO UPDATE SET
+		last_message_id = excluded.last_message_id,
+		last_sender_id = excluded.last_sender_id,
+		last_content = excluded.last_content,
+		last_sent_at = excluded.last_sent_at,
+		unread_count = unread_count + excluded.unread_count;
+END;
+
+CREATE TRIGGER trg_messages_summary_read AFTER UPDATE OF is_read ON messages
+WHEN COALESCE(OLD.is_read, 0) != COALESCE(NEW.is_read, 0)
+BEGIN
+	UPDATE conversation_summaries
+	SET unread_count = MAX(unread_count + CASE WHEN COALESCE(NEW.is_read, 0) THEN -1 ELSE 1 END, 0)
+	WHERE user_id = NEW.receiver_id AND peer_id = NEW.sender_id;
+END;
+
+CREATE TRIGGER trg_messages_summary_delete AFTER DELETE ON messages
+BEGIN
+	UPDATE conversation_summaries SET unread_count = MAX(unread_count - 1, 0)
+	WHERE user_id = OLD.receiver_id AND peer_id = OLD.sender_id AND NOT COALESCE(OLD.is_read, 0);
+	-- Only deleting the newest message of the pair needs a new "last message"
+	UPDATE conversation_summaries
+	SET (last_message_id, last_sender_id, last_content, last_sent_at) = (
+		SELECT id, sender_id, message_content, sent_at FROM messages
+		WHERE MIN(sender_id, receiver_id) = MIN(OLD.sender_id, OLD.receiver_id)
+			AND MAX(sender_id, receiver_id) = MAX(OLD.sender_id, OLD.receiver_id)
+		ORDER BY id DESC LIMIT 1
+	)
+	WHERE ((user_id = OLD.sender_id AND peer_id = OLD.receiver_id) OR (user_id = OLD.receiver_id AND peer_id = OLD.sender_id))
+		AND last_message_id = OLD.id;
+	DELETE FROM conversation_summaries
+	WHERE ((user_id = OLD.sender_id AND peer_id = OLD.receiver_id) OR (user_id = OLD.receiver_id AND peer_id = OLD.sender_id))
+		AND last_message_id IS NULL;
+END;
+"""
+
+
+def _m008_conversation_summaries(conn: sqlite3.Connection):
+	_execute_script(conn, CONVERSATION_SUMMARIES_SQL)
+
+
+USERS_FTS_SQL = """
+-- Admin search: trigram full-text index over the users table, synced by triggers
+CREATE VIRTUAL TABLE users_fts USING fts5(
+	username, discord_id, email,
+	content='users', content_rowid='id', tokenize='trigram'
+);
+INSERT INTO users_fts(users_fts) VALUES ('rebuild');
+
+CREATE TRIGGER trg_users_fts_insert AFTER INSERT ON users
+BEGIN
+	INSERT INTO users_fts(rowid, username, discord_id, email) VALUES (NEW.id, NEW.username, NEW.discord_id, NEW.email);
+END;
+
+CREATE TRIGGER trg_users_fts_delete AFTER DELETE ON users
+BEGIN
+	INSERT INTO users_fts(users_fts, rowid, username, discord_id, email) VALUES ('delete', OLD.id, OLD.username, OLD.discord_id, OLD.email);
+END;
+
+CREATE TRIGGER trg_users_fts_update AFTER UPDATE OF username, discord_id, email ON users
+BEGIN
+	INSERT INTO users_fts(users_fts, rowid, username, discord_id, email) VALUES ('delete', OLD.id, OLD.username, OLD.discord_id, OLD.email);
+	INSERT INTO users_fts(rowid, username, discord_id, email) VALUES (NEW.id, NEW.username, NEW.discord_id, NEW.email);
+END;
+
+-- Admin user list pages newest first by keyset
+CREATE INDEX idx_users_created ON users(created_at, id);
+"""
+
+
+def _m009_users_fts(conn: sqlite3.Connection):
+	_execute_script(conn, USERS_FTS_SQL)
+
+
+STATS_SQL = """
+-- Dashboard statistics maintained by triggers, so reading them never scans the fact tables.
+-- stats_counters holds running totals; stats_daily holds per-day event counts (UTC days).
+CREATE TABLE stats_counters (
+	name TEXT PRIMARY KEY,
+	value INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE stats_daily (
+	day DATE NOT NULL,
+	name TEXT NOT NULL,
+	value INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY (day, name)
+) WITHOUT ROWID;
+
+INSERT INTO stats_counters (name, value)
+SELECT 'users', COUNT(*) FROM users
+UNION ALL SELECT 'mutual_matches', COUNT(*) FROM mutual_matches
+UNION ALL SELECT 'messages', COUNT(*) FROM messages;
+
+INSERT INTO stats_daily (day, name, value)
+SELECT date(created_at), 'signups', COUNT(*) FROM users WHERE created_at IS NOT NULL GROUP BY 1
+UNION ALL SELECT date(created_at), 'swipes', COUNT(*) FROM matches WHERE created_at IS NOT NULL GROUP BY 1
+UNION ALL SELECT date(created_at), 'likes', COUNT(*) FROM matches WHERE created_at IS NOT NULL AND action = 'like' GROUP BY 1
+UNION ALL SELECT date(created_at), 'matches', COUNT(*) FROM mutual_matches WHERE created_at IS NOT NULL GROUP BY 1
+UNION ALL SELECT date(sent_at), 'messages', COUNT(*) FROM messages WHERE sent_at IS NOT NULL GROUP BY 1;
+
+CREATE TRIGGER trg_stats_users_insert AFTER INSERT ON users
+BEGIN
+	UPDATE stats_counters SET value = value + 1 WHERE name = 'users';
+	INSERT INTO stats_daily (day, name, value) VALUES (date('now'), 'signups', 1) ON CONFLICT(day, name) DO UPDATE SET value = value + 1;
+END;
+CREATE TRIGGER trg_stats_users_delete AFTER DELETE ON users
+BEGIN
+	UPDATE stats_counters SET value = value - 1 WHERE name = 'users';
+END;
+
+CREATE TRIGGER trg_stats_matches_insert AFTER INSERT ON matches
+BEGIN
+	INSERT INTO stats_daily (day, name, value) VALUES (date('now'), 'swipes', 1) ON CONFLICT(day, name) DO UPDATE SET value = value + 1;
+	INSERT INTO stats_daily (day, name, value) SELECT date('now'), 'likes', 1 WHERE NEW.action = 'like'
+		ON CONFLICT(day, name) DO UPDATE SET value = value + 1;
+END;
+-- A repeat swipe on the same profile updates its row instead of inserting one
+CREATE TRIGGER trg_stats_matches_update AFTER UPDATE OF action ON matches
+BEGIN
+	INSERT INTO stats_daily (day, name, value) VALUES (date('now'), 'swipes', 1) ON CONFLICT(day, name) DO UPDATE SET value = value + 1;
+	INSERT INTO stats_daily (day, name, value) SELECT date('now'), 'likes', 1 WHERE NEW.action = 'like'
+		ON CONFLICT(day, name) DO UPDATE SET value = value + 1;
+END;
+
+CREATE TRIGGER trg_stats_mutual_matches_insert AFTER INSERT ON mutual_matches
+BEGIN
+	UPDATE stats_counters SET value = value + 1 WHERE name = 'mutual_matches';
+	INSERT INTO stats_daily (day, name, value) VALUES (date('now'), 'matches', 1) ON CONFLICT(day, name) DO UPDATE SET value = value + 1;
+END;
+CREATE TRIGGER trg_stats_mutual_matches_delete AFTER DELETE ON mutual_matches
+BEGIN
+	UPDATE stats_counters SET value = value - 1 WHERE name = 'mutual_matches';
+END;
+
+CREATE TRIGGER trg_stats_messages_insert AFTER INSERT ON messages
+BEGIN
+	UPDATE stats_counters SET value = value + 1 WHERE name = 'messages';
+	INSERT INTO stats_daily (day, name, value) VALUES (date('now'), 'messages', 1) ON CONFLICT(day, name) DO UPDATE SET value = value + 1;
+END;
+CREATE TRIGGER trg_stats_messages_delete AFTER DELETE ON messages
+BEGIN
+	UPDATE stats_counters SET value = value - 1 WHERE name = 'messages';
+END;
+"""
+
+
+def _m010_stats(conn: sqlite3.Connection):
+	_execute_script(conn, STATS_SQL)
+
+
+ADMIN_JOBS_SQL = """
+-- Background admin jobs (see jobs.py); kept in the database so any worker can report on them
+CREATE TABLE admin_jobs (
+	id INTEGER PRIMARY KEY AUTOINCREMENT,
+	kind TEXT NOT NULL,
+	target_id INTEGER,
+	status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+	deleted INTEGER NOT NULL DEFAULT 0,
+	error TEXT,
+	created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+	finished_at DATETIME
+);
+"""
+
+
+def _m011_admin_jobs(conn: sqlite3.Connection):
+	_execute_script(conn, ADMIN_JOBS_SQL)
+
+
+def _m012_noop(conn: sqlite3.Connection):
+	# Used to switch auto_vacuum with a full VACUUM at startup; that is now the
+	# `vacuum` command (maintenance.enable_incremental_vacuum). Kept so every
+	# database agrees on what version 12 means.
+	pass
+
+
+MESSAGE_SENDER_INDEX_SQL = """
+-- Sender side of the live-event catch-up: idx_messages_pair_time has no id column, so
+-- "sender_id = ? AND id > ?" walked everything the user ever sent
+CREATE INDEX idx_messages_sender ON messages(sender_id, id);
+"""
+
+
+def _m013_message_sender_index(conn: sqlite3.Connection):
+	_execute_script(conn, MESSAGE_SENDER_INDEX_SQL)
+
+
+def backfill_mutual_matches(conn: sqlite3.Connection) -> int:
+	"""Insert a canonical (low, high) row for every pair that liked each other."""
+	cur = conn.execute(
+		"""
+		INSERT OR IGNORE INTO mutual_matches (user1_id, user2_id, created_at)
+		SELECT m1.swiper_id, m1.swiped_id, MAX(m1.created_at, m2.created_at)
+		FROM matches m1
+		JOIN matches m2 ON m2.swiper_id = m1.swiped_id AND m2.swiped_id = m1.swiper_id AND m2.action = 'like'
+		WHERE m1.action = 'like' AND m1.swiper_id < m1.swiped_id
+		"""
+	)
+	return cur.rowcount
+
+
+# Ordered (version, name, step). Append only; never renumber or edit a shipped step.
+MIGRATIONS = [
+	(1, "baseline schema", _m001_baseline),
+	(2, "integer user ids, foreign keys and lookup indexes", _m002_integer_user_ids),
+	(3, "backfill mutual_matches from likes", backfill_mutual_matches),
+	(4, "per-user swipe decks", _m004_swipe_decks),
+	(5, "avatar url cache", _m005_avatar_cache),
+	(6, "conversation keyset index", _m006_message_pair_index),
+	(7, "message receiver index", _m007_message_receiver_index),
+	(8, "conversation summaries for the inbox", _m008_conversation_summaries),
+	(9, "full-text user search", _m009_users_fts),
+	(10, "trigger-maintained dashboard statistics", _m010_stats),
+	(11, "background admin jobs", _m011_admin_jobs),
+	(12, "incremental auto-vacuum (moved to maintenance)", _m012_noop),
+	(13, "messages sender index", _m013_message_sender_index),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+	try:
+		row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+	except sqlite3.OperationalError:
+		return 0
+	return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection = None) -> list:
+	"""Apply pending migrations in order and return the versions applied.
+
+	Each step runs in its own BEGIN IMMEDIATE transaction, which takes the
+	database write lock, so concurrent workers queue up and the version is
+	re-checked under the lock before anything runs. Waiting for the lock uses
+	MIGRATION_LOCK_TIMEOUT rather than the usual busy_timeout. Foreign keys are
+	off while steps rebuild tables and are verified before each step commits.
+	"""
+	own = conn is None
+	if own:
+		conn = connect()
+	applied = []
+	try:
+		conn.execute(f"PRAGMA busy_timeout={MIGRATION_LOCK_TIMEOUT * 1000}")
+		if not conn.execute("SELECT 1 FROM sqlite_master").fetchone():
+			# Only free on a brand-new file; existing ones need `vacuum` (see maintenance.py)
+			conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+		conn.execute("PRAGMA journal_mode=WAL")
+		conn.execute("PRAGMA foreign_keys=OFF")
+		conn.execute(
+			"""
+			CREATE TABLE IF NOT EXISTS schema_version (
+				version INTEGER PRIMARY KEY,
+				name TEXT NOT NULL,
+				applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+			)
+			"""
+		)
 		conn.commit()
-	cur.execute("UPDATE mutual_matches SET user1_user_id = CAST(user1_id AS INTEGER) WHERE user1_user_id IS NULL AND user1_id GLOB '[0-9]*'")
-	cur.execute("UPDATE mutual_matches SET user2_user_id = CAST(user2_id AS INTEGER) WHERE user2_user_id IS NULL AND user2_id GLOB '[0-9]*'")
-	conn.commit()
+		for version, name, step in MIGRATIONS:
+			if version <= schema_version(conn):
+				continue
+			conn.execute("BEGIN IMMEDIATE")
+			try:
+				if version <= schema_version(conn):
+					conn.rollback()
+					continue
+				step(conn)
+				if conn.execute("PRAGMA foreign_key_check").fetchone():
+					raise sqlite3.IntegrityError(f"migration {version} left dangling foreign keys")
+				conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+				conn.commit()
+			except Exception:
+				conn.rollback()
+				raise
+			applied.append(version)
+	finally:
+		conn.execute("PRAGMA foreign_keys=ON")
+		conn.execute(f"PRAGMA busy_timeout={dict(CONNECTION_PRAGMAS)['busy_timeout']}")
+		if own:
+			conn.close()
+	return applied
 
 
 def init_db():
+	# Startup fast path: one indexed read when the schema is already current
 	conn = connect()
-	cur = conn.cursor()
-	cur.executescript(SCHEMA_SQL)
-	conn.commit()
-	_migrate(conn)
-	conn.close()
+	try:
+		if schema_version(conn) < LATEST_VERSION:
+			migrate(conn)
+	finally:
+		conn.close()
+
+
+def main(argv=None):
+	import argparse
+	parser = argparse.ArgumentParser(prog="python -m anomidate_web.db", description="AnomiDate database management")
+	sub = parser.add_subparsers(dest="command")
+	sub.add_parser("migrate", help="apply pending schema migrations")
+	sub.add_parser("status", help="show the current schema version")
+	sub.add_parser("backfill-mutual-matches", help="rebuild missing mutual_matches rows from likes")
+	sub.add_parser("maintain", help="prune expired rows, optimize, vacuum and checkpoint (run from cron)")
+	sub.add_parser("vacuum", help="one-time full VACUUM that enables incremental vacuum (locks the database while it runs)")
+	args = parser.parse_args(argv)
+	if args.command == "status":
+		conn = connect()
+		current = schema_version(conn)
+		conn.close()
+		print(f"{DB_PATH}: schema version {current} (latest {LATEST_VERSION})")
+		return
+	if args.command == "backfill-mutual-matches":
+		conn = connect()
+		added = backfill_mutual_matches(conn)
+		conn.commit()
+		conn.close()
+		print(f"Added {added} mutual match(es)")
+		return
+	if args.command == "maintain":
+		from .maintenance import run
+		report = run()
+		pruned = ", ".join(f"{name} {n}" for name, n in report["pruned"].items()) or "nothing"
+		print(f"Pruned {pruned}")
+		print(f"Freed {report['freed_pages']} page(s); reclaimed {report['bytes_reclaimed']} bytes ({report['bytes_before']} -> {report['bytes_after']})")
+		if report["checkpoint"]["busy"]:
+			print("WAL checkpoint was blocked by readers; it will finish on a later run")
+		if not report["incremental_vacuum"]:
+			print("Incremental vacuum is off for this file; run `python -m anomidate_web.db vacuum` once to enable it")
+		return
+	if args.command == "vacuum":
+		from .maintenance import enable_incremental_vacuum
+		if enable_incremental_vacuum():
+			print(f"Rebuilt {DB_PATH} with incremental vacuum enabled")
+		else:
+			print(f"{DB_PATH} already uses incremental vacuum")
+		return
+	applied = migrate()
+	if applied:
+		print(f"Applied migrations {', '.join(map(str, applied))} to {DB_PATH}")
+	else:
+		print(f"{DB_PATH} is up to date (schema version {LATEST_VERSION})")
 
 
 if __name__ == "__main__":
-	init_db()
-	print(f"Initialized DB at {DB_PATH}")
+	main()
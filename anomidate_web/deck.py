@@ -0,0 +1,167 @@
+import json
+import os
+import queue
+import threading
+from .cache import TTLCache, ensure_thread
+from .db import get_db
+from .candidates import eligible_profile, pick_candidate, pick_candidates
+from .roblox import get_avatar_url, get_avatar_urls
+
+DECK_SIZE = int(os.getenv("SWIPE_DECK_SIZE", "20"))
+LOW_WATER = int(os.getenv("SWIPE_DECK_LOW_WATER", "5"))
+# The card pop() last handed each user: off the deck but not swiped yet, so
+# refill() must not queue it again. Only a refill in another worker can miss it.
+_in_flight = TTLCache(maxsize=16384, ttl=600)
+
+
+def _encode(filters: dict) -> str:
+	return json.dumps(filters or {}, sort_keys=True)
+
+
+def get_filters(user_id: int) -> dict:
+	cur = get_db().cursor()
+	cur.execute("SELECT filters FROM swipe_deck_state WHERE user_id = ?", (user_id,))
+	row = cur.fetchone()
+	return json.loads(row["filters"]) if row else {}
+
+
+def set_filters(user_id: int, filters: dict):
+	"""Remember the user's filters; a change throws away the pre-built deck."""
+	conn = get_db()
+	cur = conn.cursor()
+	encoded = _encode(filters)
+	cur.execute(
+		"""
+		INSERT INTO swipe_deck_state (user_id, filters) VALUES (?, ?)
+		ON CONFLICT(user_id) DO UPDATE SET filters = excluded.filters WHERE filters != excluded.filters
+		""",
+		(user_id, encoded),
+	)
+	changed = cur.rowcount > 0
+	if changed:
+		cur.execute("DELETE FROM swipe_decks WHERE user_id = ?", (user_id,))
+	conn.commit()
+	if changed:
+		schedule_refill(user_id)
+
+
+def pop(user_id: int):
+	"""Take the next card off the user's deck as (profile row, avatar url).
+
+	Returns (None, None) when no candidate is left. Entries that stopped being
+	eligible since the deck was built (swiped elsewhere, banned) are skipped.
+	"""
+	conn = get_db()
+	cur = conn.cursor()
+	while True:
+		cur.execute(
+			"""
+			DELETE FROM swipe_decks
+			WHERE user_id = ?1 AND position = (SELECT MIN(position) FROM swipe_decks WHERE user_id = ?1)
+			RETURNING candidate_id, avatar_url
+			""",
+			(user_id,),
+		)
+		entry = cur.fetchone()
+		conn.commit()
+		if entry is None:
+			break
+		profile = eligible_profile(user_id, entry["candidate_id"])
+		if profile is not None:
+			_in_flight.set(user_id, profile["id"])
+			if _remaining(cur, user_id) < LOW_WATER:
+				schedule_refill(user_id)
+			return profile, entry["avatar_url"]
+	# Cold deck: serve one card inline and build the rest in the background
+	profile = pick_candidate(user_id, get_filters(user_id))
+	if profile is not None:
+		_in_flight.set(user_id, profile["id"])
+	schedule_refill(user_id)
+	if profile is None:
+		return None, None
+	avatar_url = get_avatar_url(int(profile["roblox_user_id"])) if profile["roblox_user_id"] else None
+	return profile, avatar_url or None
+
+
+def _remaining(cur, user_id: int) -> int:
+	cur.execute("SELECT COUNT(*) FROM swipe_decks WHERE user_id = ?", (user_id,))
+	return cur.fetchone()[0]
+
+
+def refill(user_id: int) -> int:
+	"""Top the deck back up to DECK_SIZE; returns how many cards were added."""
+	conn = get_db()
+	cur = conn.cursor()
+	cur.execute("SELECT filters FROM swipe_deck_state WHERE user_id = ?", (user_id,))
+	row = cur.fetchone()
+	encoded = row["filters"] if row else _encode({})
+	cur.execute("SELECT candidate_id FROM swipe_decks WHERE user_id = ?", (user_id,))
+	queued = [r[0] for r in cur.fetchall()]
+	need = DECK_SIZE - len(queued)
+	if need <= 0:
+		return 0
+	in_flight = _in_flight.get(user_id)
+	exclude = queued + [in_flight] if in_flight is not None else queued
+	picked = pick_candidates(user_id, json.loads(encoded), count=need, exclude=exclude)
+	# Resolve avatars (one batched lookup) before taking the write lock
+	avatars = get_avatar_urls(p["roblox_user_id"] for p in picked)
+	cards = [(p["id"], p["roblox_user_id"], avatars.get(p["roblox_user_id"]) or None) for p in picked]
+	conn.execute("BEGIN IMMEDIATE")
+	try:
+		cur.execute(
+			"""
+			INSERT INTO swipe_deck_state (user_id, filters) VALUES (?, ?)
+			ON CONFLICT(user_id) DO NOTHING
+			""",
+			(user_id, encoded),
+		)
+		cur.execute("SELECT filters, next_position FROM swipe_deck_state WHERE user_id = ?", (user_id,))
+		state = cur.fetchone()
+		if state["filters"] != encoded:
+			# Filters changed while we were picking; that change scheduled its own refill
+			conn.rollback()
+			return 0
+		position = state["next_position"]
+		cur.executemany(
+			"""
+			INSERT INTO swipe_decks (user_id, position, candidate_id, roblox_user_id, avatar_url)
+			SELECT ?1, ?2, ?3, ?4, ?5
+			WHERE NOT EXISTS (SELECT 1 FROM swipe_decks WHERE user_id = ?1 AND candidate_id = ?3)
+			""",
+			[(user_id, position + i, cid, ruid, url) for i, (cid, ruid, url) in enumerate(cards)],
+		)
+		cur.execute(
+			"UPDATE swipe_deck_state SET next_position = ?, refilled_at = CURRENT_TIMESTAMP WHERE user_id = ?",
+			(position + len(cards), user_id),
+		)
+		conn.commit()
+	except Exception:
+		conn.rollback()
+		raise
+	return len(cards)
+
+
+# Background refill queue, drained by one thread per worker
+_queue = queue.Queue()
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def schedule_refill(user_id: int):
+	with _pending_lock:
+		if user_id in _pending:
+			return
+		_pending.add(user_id)
+	ensure_thread("swipe-deck-refill", _refill_loop)
+	_queue.put(user_id)
+
+
+def _refill_loop():
+	while True:
+		user_id = _queue.get()
+		with _pending_lock:
+			_pending.discard(user_id)
+		try:
+			refill(user_id)
+		except Exception as e:
+			print("Swipe deck refill failed:", e)
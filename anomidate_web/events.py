@@ -0,0 +1,220 @@
+import json
+import os
+import queue
+import threading
+import time
+from .cache import ensure_thread
+from .db import get_db
+
+# Live events (new messages and mutual matches) for /api/messages/stream.
+# Each worker runs one poller thread that tails messages and mutual_matches by
+# id and fans rows out to that worker's subscribers, so a message written by
+# any gunicorn worker reaches streams on every worker within POLL_INTERVAL.
+# Writers call notify() to have their own worker's poller look right away.
+POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "1.0"))
+POLL_BATCH = 500
+HEARTBEAT = 15.0
+STREAM_SECONDS = 300  # streams end after this; EventSource reconnects with Last-Event-ID
+SUBSCRIBER_QUEUE = 256
+
+
+class Subscription:
+	__slots__ = ("user_id", "queue", "overflowed")
+
+	def __init__(self, user_id: int):
+		self.user_id = user_id
+		self.queue = queue.Queue(SUBSCRIBER_QUEUE)
+		self.overflowed = False
+
+
+_subscribers = {}
+_lock = threading.Lock()
+_wake = threading.Event()
+_high_water = None  # (message id, match id) the poller has published up to
+
+
+def parse_cursor(value: str):
+	"""Parse a "<message id>:<match id>" event id; None if absent or malformed."""
+	try:
+		message_id, match_id = (int(part) for part in (value or "").split(":"))
+	except ValueError:
+		return None
+	return message_id, match_id
+
+
+def format_cursor(cursor) -> str:
+	return f"{cursor[0]}:{cursor[1]}"
+
+
+def _current_ids(cur):
+	cur.execute("SELECT (SELECT MAX(id) FROM messages), (SELECT MAX(id) FROM mutual_matches)")
+	message_id, match_id = cur.fetchone()
+	return message_id or 0, match_id or 0
+
+
+def message_payload(row) -> dict:
+	return {
+		"id": row["id"],
+		"senderId": row["sender_id"],
+		"receiverId": row["receiver_id"],
+		"content": row["message_content"],
+		"sentAt": row["sent_at"],
+		"read": bool(row["is_read"]),
+	}
+
+
+def _match_payload(row, user_id: int) -> dict:
+	other = row["user2_id"] if row["user1_id"] == user_id else row["user1_id"]
+	return {"id": row["id"], "userId": other, "createdAt": row["created_at"]}
+
+
+def subscribe(user_id: int) -> Subscription:
+	global _high_water
+	sub = Subscription(user_id)
+	with _lock:
+		if _high_water is None:
+			# Poller was idle: start it from now; subscribers catch up from the DB themselves
+			_high_water = _current_ids(get_db().cursor())
+		_subscribers.setdefault(user_id, set()).add(sub)
+	ensure_thread("events-poller", _poll_loop)
+	return sub
+
+
+def unsubscribe(sub: Subscription):
+	with _lock:
+		subs = _subscribers.get(sub.user_id)
+		if subs is not None:
+			subs.discard(sub)
+			if not subs:
+				del _subscribers[sub.user_id]
+
+
+def notify():
+	"""Wake this worker's poller after writing a message or match."""
+	_wake.set()
+
+
+def _publish(user_id: int, event):
+	with _lock:
+		subs = list(_subscribers.get(user_id, ()))
+	for sub in subs:
+		try:
+			sub.queue.put_nowait(event)
+		except queue.Full:
+			# A stalled client; end its stream and let it resume from its cursor
+			sub.overflowed = True
+
+
+def _poll_once():
+	global _high_water
+	with _lock:
+		if not _subscribers:
+			_high_water = None
+			return
+		message_id, match_id = _high_water
+	cur = get_db().cursor()
+	cur.execute(
+		"SELECT id, sender_id, receiver_id, message_content, sent_at, is_read FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+		(message_id, POLL_BATCH),
+	)
+	for row in cur.fetchall():
+		message_id = row["id"]
+		event = ("message", (message_id, 0), message_payload(row))
+		_publish(row["sender_id"], event)
+		_publish(row["receiver_id"], event)
+	cur.execute(
+		"SELECT id, user1_id, user2_id, created_at FROM mutual_matches WHERE id > ? ORDER BY id LIMIT ?",
+		(match_id, POLL_BATCH),
+	)
+	for row in cur.fetchall():
+		match_id = row["id"]
+		for user_id in (row["user1_id"], row["user2_id"]):
+			_publish(user_id, ("match", (0, match_id), _match_payload(row, user_id)))
+	with _lock:
+		if _high_water is not None:
+			_high_water = (message_id, match_id)
+
+
+def _poll_loop():
+	while True:
+		_wake.wait(POLL_INTERVAL)
+		_wake.clear()
+		try:
+			_poll_once()
+		except Exception as e:
+			print("Event poll failed:", e)
+
+
+def _frame(kind: str, cursor, data) -> str:
+	return f"id: {format_cursor(cursor)}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+def _backlog(user_id: int, cursor):
+	"""Events for user_id after cursor straight from the database, in id order."""
+	cur = get_db().cursor()
+	message_id, match_id = cursor
+	while True:
+		# Each side walks its (user, id) index from the cursor, so a batch reads at most
+		# 2 * POLL_BATCH rows however much history the user has
+		cur.execute(
+			"""
+			SELECT * FROM (
+				SELECT * FROM (
+					SELECT id, sender_id, receiver_id, message_content, sent_at, is_read FROM messages
+					WHERE receiver_id = ?2 AND id > ?1 ORDER BY id LIMIT ?3
+				)
+				UNION ALL
+				SELECT * FROM (
+					SELECT id, sender_id, receiver_id, message_content, sent_at, is_read FROM messages
+					WHERE sender_id = ?2 AND id > ?1 ORDER BY id LIMIT ?3
+				)
+			)
+			ORDER BY id LIMIT ?3
+			""",
+			(message_id, user_id, POLL_BATCH),
+		)
+		rows = cur.fetchall()
+		for row in rows:
+			message_id = row["id"]
+			yield "message", message_id, match_id, message_payload(row)
+		if len(rows) < POLL_BATCH:
+			break
+	cur.execute(
+		"""
+		SELECT id, user1_id, user2_id, created_at FROM mutual_matches
+		WHERE id > ? AND (user1_id = ? OR user2_id = ?)
+		ORDER BY id
+		""",
+		(match_id, user_id, user_id),
+	)
+	for row in cur.fetchall():
+		yield "match", message_id, row["id"], _match_payload(row, user_id)
+
+
+def stream(user_id: int, cursor=None):
+	"""Yield SSE frames for user_id, resuming after cursor (or from now when None)."""
+	sub = subscribe(user_id)
+	try:
+		if cursor is None:
+			cursor = _current_ids(get_db().cursor())
+		yield f"retry: 3000\nid: {format_cursor(cursor)}\n\n"
+		for kind, message_id, match_id, data in _backlog(user_id, cursor):
+			cursor = (message_id, match_id)
+			yield _frame(kind, cursor, data)
+		deadline = time.monotonic() + STREAM_SECONDS
+		while time.monotonic() < deadline and not sub.overflowed:
+			try:
+				kind, (message_id, match_id), data = sub.queue.get(timeout=HEARTBEAT)
+			except queue.Empty:
+				yield ": keepalive\n\n"
+				continue
+			# The poller and the backlog overlap; anything at or below the cursor was already sent
+			if kind == "message" and message_id > cursor[0]:
+				cursor = (message_id, cursor[1])
+			elif kind == "match" and match_id > cursor[1]:
+				cursor = (cursor[0], match_id)
+			else:
+				continue
+			yield _frame(kind, cursor, data)
+	finally:
+		unsubscribe(sub)
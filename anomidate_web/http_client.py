@@ -0,0 +1,194 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+# Outbound HTTP for Roblox and Discord: one pooled keep-alive Session per worker
+# process, tight timeouts, and bounded jittered retries on 429/5xx.
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "5"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+RETRY_BACKOFF = 0.25  # seconds, doubled per attempt and jittered
+RETRY_BACKOFF_MAX = 2.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Max connections kept (and allowed at once) per host; other hosts get DEFAULT_POOL_SIZE
+HOST_POOL_SIZES = {
+	"https://users.roblox.com": 10,
+	"https://thumbnails.roblox.com": 10,
+	"https://apis.roblox.com": 4,
+	"https://discord.com": 4,
+}
+DEFAULT_POOL_SIZE = 4
+
+# Circuit breaker per host: after BREAKER_FAILURES consecutive failures calls
+# fail fast for BREAKER_RESET seconds, then a single probe decides whether to close
+BREAKER_HOSTS = ("users.roblox.com", "thumbnails.roblox.com")
+BREAKER_FAILURES = int(os.getenv("HTTP_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("HTTP_BREAKER_RESET", "30"))
+
+
+class CircuitOpenError(requests.ConnectionError):
+	"""Raised instead of calling a host whose breaker is open."""
+
+
+class CircuitBreaker:
+	CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+	def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET):
+		self.name = name
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+		self.state = self.CLOSED
+		self.failures = 0
+		self.opened_at = 0.0
+		self.rejected = 0
+		self._lock = threading.Lock()
+
+	def allow(self) -> bool:
+		"""True if a call may go out now; once open, one probe per reset_timeout is let through."""
+		with self._lock:
+			if self.state == self.CLOSED:
+				return True
+			now = time.monotonic()
+			if now - self.opened_at >= self.reset_timeout:
+				# Re-stamp so a probe that never reports back cannot wedge the breaker
+				self.state = self.HALF_OPEN
+				self.opened_at = now
+				return True
+			self.rejected += 1
+			return False
+
+	def record_success(self):
+		with self._lock:
+			self.state = self.CLOSED
+			self.failures = 0
+
+	def record_failure(self):
+		with self._lock:
+			self.failures += 1
+			if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+				self.state = self.OPEN
+				self.opened_at = time.monotonic()
+
+	def snapshot(self) -> dict:
+		with self._lock:
+			return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+_breakers = {host: CircuitBreaker(host) for host in BREAKER_HOSTS}
+
+
+def breaker_for(url: str):
+	return _breakers.get(urlsplit(url).hostname)
+
+
+def breaker_stats() -> dict:
+	return {host: b.snapshot() for host, b in _breakers.items()}
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+	"""The process-wide Session; rebuilt after fork so workers never share sockets."""
+	global _session, _session_pid
+	with _session_lock:
+		if _session is None or _session_pid != os.getpid():
+			session = requests.Session()
+			session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=DEFAULT_POOL_SIZE, pool_block=True))
+			for prefix, size in HOST_POOL_SIZES.items():
+				session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=size, pool_block=True))
+			_session = session
+			_session_pid = os.getpid()
+		return _session
+
+
+def _record(endpoint: str, elapsed_ms: float, ok: bool):
+	with _stats_lock:
+		s = _stats.setdefault(endpoint, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+		s["count"] += 1
+		s["total_ms"] += elapsed_ms
+		s["max_ms"] = max(s["max_ms"], elapsed_ms)
+		if not ok:
+			s["errors"] += 1
+
+
+def endpoint_stats() -> dict:
+	with _stats_lock:
+		return {
+			name: {**s, "avg_ms": round(s["total_ms"] / s["count"], 2) if s["count"] else 0.0}
+			for name, s in _stats.items()
+		}
+
+
+def _backoff(attempt: int, resp=None) -> float:
+	if resp is not None:
+		retry_after = resp.headers.get("Retry-After", "")
+		if retry_after.isdigit():
+			return min(float(retry_after), RETRY_BACKOFF_MAX)
+	delay = RETRY_BACKOFF * (2 ** attempt)
+	return min(delay * random.uniform(0.5, 1.5), RETRY_BACKOFF_MAX)
+
+
+def request(method: str, url: str, *, endpoint: str = None, idempotent: bool = None, timeout=None, **kwargs) -> requests.Response:
+	"""Send a request through the shared session.
+
+	endpoint names the call in endpoint_stats() (defaults to host + path, so
+	pass one when the path embeds ids). Connection errors and 429/5xx answers
+	are retried up to MAX_RETRIES times, but only for idempotent requests;
+	set idempotent=True for a POST that is safe to repeat. Hosts guarded by a
+	circuit breaker raise CircuitOpenError while it is open.
+	"""
+	method = method.upper()
+	if endpoint is None:
+		parts = urlsplit(url)
+		endpoint = f"{method} {parts.netloc}{parts.path}"
+	if idempotent is None:
+		idempotent = method in IDEMPOTENT_METHODS
+	retries = MAX_RETRIES if idempotent else 0
+	timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+	session = get_session()
+	breaker = breaker_for(url)
+	if breaker is not None and not breaker.allow():
+		raise CircuitOpenError(f"circuit open for {breaker.name}")
+	for attempt in range(retries + 1):
+		start = time.perf_counter()
+		try:
+			resp = session.request(method, url, timeout=timeout, **kwargs)
+		except requests.RequestException:
+			_record(endpoint, (time.perf_counter() - start) * 1000, False)
+			if attempt >= retries:
+				if breaker is not None:
+					breaker.record_failure()
+				raise
+			time.sleep(_backoff(attempt))
+			continue
+		retryable = resp.status_code in RETRY_STATUSES
+		_record(endpoint, (time.perf_counter() - start) * 1000, not retryable)
+		if retryable and attempt < retries:
+			time.sleep(_backoff(attempt, resp))
+			continue
+		if breaker is not None:
+			# 429 means "slow down", not "down"; only 5xx counts against the host
+			if resp.status_code >= 500:
+				breaker.record_failure()
+			else:
+				breaker.record_success()
+		return resp
+
+
+def get(url: str, **kwargs) -> requests.Response:
+	return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+	return request("POST", url, **kwargs)
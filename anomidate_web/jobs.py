@@ -0,0 +1,187 @@
+import os
+import queue
+import sqlite3
+import time
+from . import db, verification
+from .auth import forget_user
+from .cache import ensure_thread
+from .db import get_db
+from .routes_matches import forget_pair
+
+# Admin deletes run here instead of in the request: rows go in chunks of
+# JOB_CHUNK, each in its own short BEGIN IMMEDIATE transaction, with a
+# JOB_PAUSE gap so swipes and messages can take the write lock in between.
+# Job rows live in admin_jobs, so /admin/jobs/<id> works from any worker.
+JOB_CHUNK = int(os.getenv("ADMIN_JOB_CHUNK", "500"))
+JOB_PAUSE = 0.05
+
+DELETE_USER = "delete_user"
+WIPE = "wipe"  # swap in a freshly migrated database
+WIPE_ROWS = "wipe_rows"  # chunked deletes of every row
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# (table, key) in delete order: dependents before users. key is what the chunk
+# subquery selects: the primary key columns for WITHOUT ROWID tables.
+_TABLES = (
+	("messages", "rowid"),
+	("mutual_matches", "rowid"),
+	("matches", "rowid"),
+	("swipe_decks", "user_id, position"),
+	("swipe_deck_state", "rowid"),
+	("conversation_summaries", "user_id, peer_id"),
+	("daily_swipes", "user_id, swipe_date"),
+	("roblox_verification", "rowid"),
+	("password_resets", "rowid"),
+	("users", "rowid"),
+)
+_KEYS = dict(_TABLES)
+
+# Every row that references a user, by the column(s) pointing at them
+_USER_REFERENCES = (
+	("messages", "sender_id"),
+	("messages", "receiver_id"),
+	("mutual_matches", "user1_id"),
+	("mutual_matches", "user2_id"),
+	("matches", "swiper_id"),
+	("matches", "swiped_id"),
+	("swipe_decks", "user_id"),
+	("swipe_decks", "candidate_id"),
+	("swipe_deck_state", "user_id"),
+	("conversation_summaries", "user_id"),
+	("conversation_summaries", "peer_id"),
+	("daily_swipes", "user_id"),
+	("roblox_verification", "user_id"),
+	("users", "id"),
+)
+
+
+def submit(kind: str, target_id: int = None) -> int:
+	"""Record a job and queue it on this worker's runner; returns the job id."""
+	conn = get_db()
+	cur = conn.cursor()
+	cur.execute("INSERT INTO admin_jobs (kind, target_id) VALUES (?, ?) RETURNING id", (kind, target_id))
+	job_id = cur.fetchone()[0]
+	conn.commit()
+	ensure_thread("admin-jobs", _run_loop)
+	_queue.put(job_id)
+	return job_id
+
+
+def get(job_id: int):
+	cur = get_db().cursor()
+	cur.execute("SELECT id, kind, target_id, status, deleted, error, created_at, finished_at FROM admin_jobs WHERE id = ?", (job_id,))
+	row = cur.fetchone()
+	return dict(row) if row else None
+
+
+def _delete_chunked(conn, job_id: int, table: str, where: str = "1", params=()) -> int:
+	key = _KEYS[table]
+	deleted = 0
+	while True:
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			cur = conn.execute(
+				f"DELETE FROM {table} WHERE ({key}) IN (SELECT {key} FROM {table} WHERE {where} LIMIT ?)",
+				(*params, JOB_CHUNK),
+			)
+			n = cur.rowcount
+			conn.execute("UPDATE admin_jobs SET deleted = deleted + ? WHERE id = ?", (n, job_id))
+			conn.commit()
+		except Exception:
+			conn.rollback()
+			raise
+		deleted += n
+		if n < JOB_CHUNK:
+			return deleted
+		time.sleep(JOB_PAUSE)
+
+
+def _delete_user(conn, job_id: int, user_id: int):
+	row = conn.execute("SELECT email FROM users WHERE id = ?", (user_id,)).fetchone()
+	if row is None:
+		return
+	for table, column in _USER_REFERENCES:
+		_delete_chunked(conn, job_id, table, f"{column} = ?", (user_id,))
+	if row["email"]:
+		# Emails are not unique; codes for an address another account still uses are
+		# left to the retention pruning in maintenance.py
+		_delete_chunked(
+			conn, job_id, "password_resets",
+			"email = ? AND NOT EXISTS (SELECT 1 FROM users WHERE email = ? AND id != ?)",
+			(row["email"], row["email"], user_id),
+		)
+	verification.invalidate(user_id)
+	forget_user(user_id)
+	# Pairs are keyed by both ids; dropping them all is simpler than finding this user's
+	forget_pair()
+
+
+def _wipe_rows(conn, job_id: int, target_id=None):
+	for table, _ in _TABLES:
+		_delete_chunked(conn, job_id, table)
+	verification.invalidate()
+	forget_user()
+	forget_pair()
+
+
+def _wipe(conn, job_id: int, target_id=None):
+	"""Replace the whole database with an empty, fully migrated one.
+
+	The new schema is built in memory and copied over the live file with the
+	backup API, which takes the write lock once for a copy the size of the
+	empty schema instead of deleting row by row. AUTOINCREMENT sequences and
+	admin_jobs are carried over so ids are never handed out twice.
+	"""
+	fresh = sqlite3.connect(":memory:")
+	try:
+		fresh.execute(f"PRAGMA page_size={conn.execute('PRAGMA page_size').fetchone()[0]}")
+		db.migrate(fresh)
+		fresh.execute("DELETE FROM sqlite_sequence")
+		fresh.executemany("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", conn.execute("SELECT name, seq FROM sqlite_sequence").fetchall())
+		fresh.executemany("INSERT INTO admin_jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", conn.execute("SELECT * FROM admin_jobs").fetchall())
+		fresh.commit()
+		deleted = conn.execute("SELECT value FROM stats_counters WHERE name = 'users'").fetchone()
+		fresh.backup(conn)
+	finally:
+		fresh.close()
+	conn.execute("UPDATE admin_jobs SET deleted = ? WHERE id = ?", (deleted[0] if deleted else 0, job_id))
+	conn.commit()
+	verification.invalidate()
+	forget_user()
+	forget_pair()
+
+
+_HANDLERS = {DELETE_USER: _delete_user, WIPE: _wipe, WIPE_ROWS: _wipe_rows}
+
+
+def _run(job_id: int):
+	conn = get_db()
+	row = conn.execute("SELECT kind, target_id FROM admin_jobs WHERE id = ?", (job_id,)).fetchone()
+	if row is None:
+		return
+	conn.execute("UPDATE admin_jobs SET status = ? WHERE id = ?", (RUNNING, job_id))
+	conn.commit()
+	try:
+		_HANDLERS[row["kind"]](conn, job_id, row["target_id"])
+	except Exception as e:
+		conn.rollback()
+		conn.execute("UPDATE admin_jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?", (FAILED, str(e), job_id))
+		conn.commit()
+		raise
+	conn.execute("UPDATE admin_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?", (DONE, job_id))
+	conn.commit()
+
+
+# One runner thread per worker: jobs run one at a time so two big deletes
+# never compete for the write lock
+_queue = queue.Queue()
+
+
+def _run_loop():
+	while True:
+		job_id = _queue.get()
+		try:
+			_run(job_id)
+		except Exception as e:
+			print("Admin job failed:", e)
@@ -0,0 +1,112 @@
+import os
+import time
+from . import db
+
+# Retention in days per table, overridable with the environment variables shown.
+# 0 keeps rows forever.
+RETENTION_DAYS = {
+	"daily_swipes": int(os.getenv("RETENTION_DAILY_SWIPES_DAYS", "30")),
+	"password_resets": int(os.getenv("RETENTION_PASSWORD_RESETS_DAYS", "7")),
+	"passes": int(os.getenv("RETENTION_PASSES_DAYS", "90")),  # old passes stop excluding that profile
+	"avatar_cache": int(os.getenv("RETENTION_AVATAR_CACHE_DAYS", "30")),
+	"admin_jobs": int(os.getenv("RETENTION_ADMIN_JOBS_DAYS", "30")),
+}
+PRUNE_CHUNK = int(os.getenv("PRUNE_CHUNK", "1000"))
+PRUNE_PAUSE = 0.05
+
+# name: (table, key columns, condition on rows older than the cutoff). The key
+# is walked in order so each chunk picks up where the last one stopped.
+_PRUNE = {
+	"daily_swipes": ("daily_swipes", "user_id, swipe_date", "swipe_date < date('now', ?)"),
+	"password_resets": ("password_resets", "rowid", "expires_at < datetime('now', ?)"),
+	"passes": ("matches", "rowid", "action = 'pass' AND created_at < datetime('now', ?)"),
+	"avatar_cache": ("avatar_cache", "roblox_user_id, size, circular", "fetched_at < unixepoch('now', ?)"),
+	"admin_jobs": ("admin_jobs", "rowid", "finished_at < datetime('now', ?)"),
+}
+
+
+def _prune(conn, table: str, key: str, where: str, params) -> int:
+	marks = ", ".join("?" * len(key.split(", ")))
+	last = None
+	pruned = 0
+	while True:
+		after = f"({key}) > ({marks}) AND " if last else ""
+		rows = conn.execute(
+			f"SELECT {key} FROM {table} WHERE {after}{where} ORDER BY {key} LIMIT ?",
+			(*(last or ()), *params, PRUNE_CHUNK),
+		).fetchall()
+		if not rows:
+			return pruned
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			conn.executemany(f"DELETE FROM {table} WHERE ({key}) = ({marks})", [tuple(r) for r in rows])
+			conn.commit()
+		except Exception:
+			conn.rollback()
+			raise
+		pruned += len(rows)
+		last = tuple(rows[-1])
+		if len(rows) < PRUNE_CHUNK:
+			return pruned
+		time.sleep(PRUNE_PAUSE)
+
+
+def _file_bytes() -> int:
+	return sum(os.path.getsize(p) for p in (db.DB_PATH, f"{db.DB_PATH}-wal") if os.path.exists(p))
+
+
+def enable_incremental_vacuum(conn=None) -> bool:
+	"""Switch the file to auto_vacuum=INCREMENTAL; False if it already is.
+
+	On an existing file this needs a full VACUUM, which rewrites the database
+	and blocks writers until it finishes, so it is a one-off command to run in a
+	quiet moment rather than part of run() or startup.
+	"""
+	own = conn is None
+	if own:
+		conn = db.connect()
+	try:
+		if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+			return False
+		conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+		conn.execute("VACUUM")
+		return True
+	finally:
+		if own:
+			conn.close()
+
+
+def run(conn=None, retention: dict = None) -> dict:
+	"""Prune expired rows, refresh planner stats and give free space back to the OS.
+
+	Rows go in short chunked transactions so the app keeps working meanwhile.
+	Returns a report with rows pruned per table, pages released by the
+	incremental vacuum and bytes reclaimed from the database and WAL files.
+	"""
+	own = conn is None
+	if own:
+		conn = db.connect()
+	retention = {**RETENTION_DAYS, **(retention or {})}
+	report = {"pruned": {}, "bytes_before": _file_bytes()}
+	try:
+		for name, (table, key, where) in _PRUNE.items():
+			days = retention.get(name, 0)
+			if days > 0:
+				report["pruned"][name] = _prune(conn, table, key, where, (f"-{days} days",))
+		conn.execute("PRAGMA optimize")
+		report["freed_pages"] = conn.execute("PRAGMA freelist_count").fetchone()[0]
+		report["incremental_vacuum"] = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+		if report["incremental_vacuum"]:
+			# execute() would step the pragma once (one page); executescript() runs it to completion
+			conn.executescript("PRAGMA incremental_vacuum;")
+			report["freed_pages"] -= conn.execute("PRAGMA freelist_count").fetchone()[0]
+		else:
+			report["freed_pages"] = 0
+		busy, wal_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+		report["checkpoint"] = {"busy": bool(busy), "wal_pages": wal_pages, "checkpointed": checkpointed}
+	finally:
+		if own:
+			conn.close()
+	report["bytes_after"] = _file_bytes()
+	report["bytes_reclaimed"] = max(0, report["bytes_before"] - report["bytes_after"])
+	return report
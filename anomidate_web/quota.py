@@ -0,0 +1,191 @@
+import atexit
+import os
+import threading
+import time
+from datetime import date
+from .cache import ensure_thread
+from .db import get_db
+
+MAX_DAILY_SWIPES = 50
+
+# Daily swipe quota, counted in memory. Each worker leases blocks of a user's
+# quota by bumping daily_swipes.swipe_count under BEGIN IMMEDIATE, so the row
+# holds "used + leased" across all workers and can never pass the limit. Swipes
+# are then charged against the local lease with no database access, and unused
+# lease is handed back in batches every FLUSH_INTERVAL seconds (for leases idle
+# for LEASE_IDLE) and at shutdown. A crashed worker can strand at most
+# LEASE_SIZE - 1 swipes per active user until the day rolls over.
+LEASE_SIZE = int(os.getenv("SWIPE_QUOTA_LEASE", "5"))
+FLUSH_INTERVAL = float(os.getenv("SWIPE_QUOTA_FLUSH", "30"))
+LEASE_IDLE = 120.0
+
+
+class _Lease:
+	__slots__ = ("day", "left", "claimed", "touched", "lock", "retired")
+
+	def __init__(self, day: str):
+		self.day = day
+		self.left = 0  # leased to this worker and not yet used
+		self.claimed = None  # swipe_count as last seen, None until read
+		self.touched = time.monotonic()
+		self.lock = threading.Lock()
+		self.retired = False  # handed back and dropped from _leases; callers must fetch a new one
+
+
+_leases = {}
+_leases_lock = threading.Lock()
+_stale = []  # (user_id, day, left) still to be handed back
+
+
+def _today() -> str:
+	return date.today().isoformat()
+
+
+def _lease(user_id: int) -> _Lease:
+	today = _today()
+	old = None
+	with _leases_lock:
+		lease = _leases.get(user_id)
+		if lease is None or lease.day != today:
+			old = lease
+			lease = _leases[user_id] = _Lease(today)
+	if old is not None:
+		# Yesterday's leftovers go back with the next flush
+		with old.lock:
+			left = _retire(old)
+		if left:
+			with _leases_lock:
+				_stale.append((user_id, old.day, left))
+	ensure_thread("swipe-quota-flush", _flush_loop)
+	return lease
+
+
+def _retire(lease: _Lease) -> int:
+	"""Empty a lease that is being handed back (caller holds lease.lock); returns what it held."""
+	left, lease.left, lease.retired = lease.left, 0, True
+	return left
+
+
+def _claim(user_id: int, day: str, want: int):
+	"""Lease up to want swipes from the shared row; returns (granted, swipe_count after)."""
+	conn = get_db()
+	cur = conn.cursor()
+	conn.execute("BEGIN IMMEDIATE")
+	try:
+		cur.execute("SELECT swipe_count FROM daily_swipes WHERE user_id = ? AND swipe_date = ?", (user_id, day))
+		row = cur.fetchone()
+		claimed = row[0] if row else 0
+		granted = max(0, min(want, MAX_DAILY_SWIPES - claimed))
+		if granted:
+			cur.execute(
+				"""
+				INSERT INTO daily_swipes (user_id, swipe_date, swipe_count) VALUES (?, ?, ?)
+				ON CONFLICT(user_id, swipe_date) DO UPDATE SET swipe_count = excluded.swipe_count
+				""",
+				(user_id, day, claimed + granted),
+			)
+		conn.commit()
+	except Exception:
+		conn.rollback()
+		raise
+	return granted, claimed + granted
+
+
+def take(user_id: int, n: int = 1) -> int:
+	"""Charge up to n swipes to user_id's quota for today; returns how many were granted."""
+	while True:
+		lease = _lease(user_id)
+		with lease.lock:
+			if not lease.retired:
+				return _take(lease, user_id, n)
+
+
+def _take(lease: _Lease, user_id: int, n: int) -> int:
+	if lease.left < n:
+		granted, lease.claimed = _claim(user_id, lease.day, max(n - lease.left, LEASE_SIZE))
+		lease.left += granted
+	got = min(n, lease.left)
+	lease.left -= got
+	lease.touched = time.monotonic()
+	return got
+
+
+def refund(user_id: int, n: int = 1):
+	"""Give back swipes that take() granted but were not used."""
+	if n <= 0:
+		return
+	while True:
+		lease = _lease(user_id)
+		with lease.lock:
+			if not lease.retired:
+				lease.left += n
+				return
+
+
+def remaining(user_id: int) -> int:
+	"""Swipes left today; reads the database only the first time a worker sees the user each day."""
+	while True:
+		lease = _lease(user_id)
+		with lease.lock:
+			if lease.retired:
+				continue
+			if lease.claimed is None:
+				cur = get_db().cursor()
+				cur.execute("SELECT swipe_count FROM daily_swipes WHERE user_id = ? AND swipe_date = ?", (user_id, lease.day))
+				row = cur.fetchone()
+				lease.claimed = row[0] if row else 0
+			return lease.left + max(0, MAX_DAILY_SWIPES - lease.claimed)
+
+
+def flush(force: bool = False) -> int:
+	"""Return unused lease to daily_swipes: all of it if force, else from idle leases."""
+	now = time.monotonic()
+	today = _today()
+	returns = []
+	with _leases_lock:
+		returns.extend(_stale)
+		_stale.clear()
+		for user_id, lease in list(_leases.items()):
+			# A lease that is busy claiming right now is not idle; skip rather than wait on its DB write
+			if not lease.lock.acquire(blocking=False):
+				continue
+			try:
+				if lease.day != today or force or now - lease.touched > LEASE_IDLE:
+					left = _retire(lease)
+					if left:
+						returns.append((user_id, lease.day, left))
+					del _leases[user_id]
+			finally:
+				lease.lock.release()
+	if not returns:
+		return 0
+	conn = get_db()
+	try:
+		conn.executemany(
+			"UPDATE daily_swipes SET swipe_count = MAX(swipe_count - ?, 0) WHERE user_id = ? AND swipe_date = ?",
+			[(left, user_id, day) for user_id, day, left in returns],
+		)
+		conn.commit()
+	except Exception:
+		conn.rollback()
+		with _leases_lock:
+			_stale.extend(returns)
+		raise
+	return len(returns)
+
+
+def _flush_loop():
+	while True:
+		time.sleep(FLUSH_INTERVAL)
+		try:
+			flush()
+		except Exception as e:
+			print("Swipe quota flush failed:", e)
+
+
+@atexit.register
+def _flush_at_exit():
+	try:
+		flush(force=True)
+	except Exception as e:
+		print("Swipe quota flush failed:", e)
@@ -1,46 +1,237 @@
 import os
+import threading
+import time
 import requests
+from . import http_client
+from .cache import TTLCache, submit_background
+from .db import get_db
 
 ROBLOX_USERS_API = "https://users.roblox.com/v1/usernames/users"
 ROBLOX_USER_API = "https://users.roblox.com/v1/users"
 ROBLOX_THUMB_API = "https://thumbnails.roblox.com/v1/users/avatar-headshot"
 VERIFICATION_PHRASE = os.getenv("VERIFICATION_PHRASE", "anomidate").lower()
 
+# Avatar URL cache: seconds a URL (or a "no image" answer) stays fresh, and the
+# fraction of that after which a hit also triggers a background refresh.
+# Expired entries are still served while the refresh runs.
+AVATAR_TTL = int(os.getenv("AVATAR_TTL", str(6 * 3600)))
+AVATAR_NEGATIVE_TTL = int(os.getenv("AVATAR_NEGATIVE_TTL", "300"))
+AVATAR_REFRESH_AHEAD = 0.8
+AVATAR_BATCH_LIMIT = 100  # max userIds the thumbnails API accepts per call
+_avatar_memory = TTLCache(maxsize=4096, ttl=AVATAR_TTL)
+_avatar_stats = {"db_hits": 0, "db_misses": 0, "fetches": 0, "refreshes": 0, "stale_served": 0}
+_avatar_stats_lock = threading.Lock()
+# Last answer per Roblox user, kept long so outages can be bridged with it
+_verification_last = TTLCache(maxsize=8192, ttl=7 * 24 * 3600)
+
 
 def resolve_roblox_username(username: str):
 	payload = {"usernames": [username], "excludeBannedUsers": True}
-	r = requests.post(ROBLOX_USERS_API, json=payload, timeout=10)
+	try:
+		r = http_client.post(ROBLOX_USERS_API, json=payload, endpoint="roblox.usernames", idempotent=True)
+	except requests.RequestException:
+		return None
 	if r.status_code != 200:
 		return None
 	data = r.json().get("data", [])
 	return data[0] if data else None
 
 
-def get_roblox_user_info(user_id: int):
-	r = requests.get(f"{ROBLOX_USER_API}/{user_id}", timeout=10)
-	if r.status_code != 200:
+def _fetch_roblox_user_info(user_id: int):
+	"""Returns the user dict, {} if Roblox says there is no such user, or None on failure."""
+	try:
+		r = http_client.get(f"{ROBLOX_USER_API}/{user_id}", endpoint="roblox.user_info")
+	except requests.RequestException:
 		return None
-	return r.json()
+	if r.status_code == 200:
+		return r.json()
+	if r.status_code in (400, 404):
+		return {}
+	return None
 
 
-def check_roblox_verification(user_id: int) -> bool:
-	info = get_roblox_user_info(user_id)
-	if not info:
-		return False
+def get_roblox_user_info(user_id: int):
+	return _fetch_roblox_user_info(user_id) or None
+
+
+def _verify_from_info(user_id: int, info: dict) -> bool:
 	desc = (info.get("description") or "").lower()
-	return VERIFICATION_PHRASE in desc
+	verified = VERIFICATION_PHRASE in desc
+	_verification_last.set(int(user_id), verified)
+	return verified
 
 
-def get_avatar_url(user_id: int, size: str = "150x150", circular: bool = False) -> str:
+def _revalidate_verification(user_id: int):
+	info = _fetch_roblox_user_info(user_id)
+	if info is not None:
+		_verify_from_info(user_id, info)
+
+
+def check_roblox_verification(user_id: int) -> bool:
+	"""Whether the Roblox profile bio carries VERIFICATION_PHRASE.
+
+	If Roblox is unreachable (or its circuit breaker is open) the last known
+	answer is served stale and re-checked in the background.
+	"""
+	info = _fetch_roblox_user_info(user_id)
+	if info is None:
+		last = _verification_last.get(int(user_id))
+		if last is None:
+			return False
+		submit_background(("verification", int(user_id)), _revalidate_verification, user_id)
+		return last
+	return _verify_from_info(user_id, info)
+
+
+def _fetch_avatar_urls(user_ids, size: str, circular: bool):
+	"""One thumbnails call for up to AVATAR_BATCH_LIMIT ids.
+
+	Returns {id: url}, with "" for ids Roblox has no image for, or None if
+	the request itself failed.
+	"""
 	params = {
-		"userIds": str(user_id),
+		"userIds": ",".join(str(u) for u in user_ids),
 		"size": size,
 		"format": "Png",
 		"isCircular": "true" if circular else "false",
 	}
-	r = requests.get(ROBLOX_THUMB_API, params=params, timeout=10)
-	if r.status_code == 200:
-		data = r.json().get("data") or []
-		if data:
-			return data[0].get("imageUrl") or ""
-	return ""
+	try:
+		r = http_client.get(ROBLOX_THUMB_API, params=params, endpoint="roblox.thumbnails")
+	except requests.RequestException:
+		return None
+	if r.status_code != 200:
+		return None
+	found = {}
+	for item in r.json().get("data") or []:
+		if item.get("targetId") is not None:
+			found[int(item["targetId"])] = item.get("imageUrl") or ""
+	return {u: found.get(u, "") for u in user_ids}
+
+
+def _load_avatars(user_ids, size: str, circular: int) -> dict:
+	found = {}
+	cur = get_db().cursor()
+	for i in range(0, len(user_ids), AVATAR_BATCH_LIMIT):
+		chunk = user_ids[i:i + AVATAR_BATCH_LIMIT]
+		cur.execute(
+			"SELECT roblox_user_id, image_url, fetched_at FROM avatar_cache WHERE size = ? AND circular = ? AND roblox_user_id IN (%s)"
+			% ",".join("?" * len(chunk)),
+			[size, circular, *chunk],
+		)
+		for row in cur.fetchall():
+			found[row["roblox_user_id"]] = (row["image_url"], row["fetched_at"])
+	return found
+
+
+def _store_avatars(urls: dict, size: str, circular: int, fetched_at: float):
+	if not urls:
+		return
+	conn = get_db()
+	# Ride along with the caller's transaction if one is open rather than committing it early
+	owns_txn = not conn.in_transaction
+	conn.executemany(
+		"""
+		INSERT INTO avatar_cache (roblox_user_id, size, circular, image_url, fetched_at) VALUES (?, ?, ?, ?, ?)
+		ON CONFLICT(roblox_user_id, size, circular) DO UPDATE SET image_url = excluded.image_url, fetched_at = excluded.fetched_at
+		""",
+		[(u, size, circular, url, fetched_at) for u, url in urls.items()],
+	)
+	if owns_txn:
+		conn.commit()
+	for u, url in urls.items():
+		_avatar_memory.set((u, size, circular), (url, fetched_at), ttl=_avatar_ttl(url))
+
+
+def _avatar_ttl(url: str) -> float:
+	return AVATAR_TTL if url else AVATAR_NEGATIVE_TTL
+
+
+def _refresh_avatars(user_ids, size: str, circular: int):
+	for i in range(0, len(user_ids), AVATAR_BATCH_LIMIT):
+		fetched = _fetch_avatar_urls(user_ids[i:i + AVATAR_BATCH_LIMIT], size, bool(circular))
+		if fetched is not None:
+			_store_avatars(fetched, size, circular, time.time())
+
+
+def get_avatar_urls(user_ids, size: str = "150x150", circular: bool = False) -> dict:
+	"""Headshot URLs for many Roblox users as {id: url}, "" where there is none.
+
+	Ids are deduplicated and served from an in-process LRU, then the
+	avatar_cache table; whatever is left is fetched from the thumbnails API
+	in chunks of AVATAR_BATCH_LIMIT. Entries past AVATAR_REFRESH_AHEAD of
+	their TTL, and expired ones, are returned immediately and refreshed in the
+	background (stale-while-revalidate), so only never-seen ids can wait on
+	Roblox, and those fail fast to "" while the thumbnails breaker is open.
+	"""
+	ids = list(dict.fromkeys(int(u) for u in user_ids if u))
+	circ = 1 if circular else 0
+	entries = {}
+	for u in ids:
+		entry = _avatar_memory.get((u, size, circ))
+		if entry is not None:
+			entries[u] = entry
+	cold = [u for u in ids if u not in entries]
+	if cold:
+		loaded = _load_avatars(cold, size, circ)
+		_count(db_hits=len(loaded), db_misses=len(cold) - len(loaded))
+		for u, entry in loaded.items():
+			_avatar_memory.set((u, size, circ), entry, ttl=_avatar_ttl(entry[0]))
+		entries.update(loaded)
+	now = time.time()
+	result, missing, ageing = {}, [], []
+	stale = 0
+	for u in ids:
+		entry = entries.get(u)
+		if entry:
+			url, fetched_at = entry
+			age = now - fetched_at
+			ttl = _avatar_ttl(url)
+			result[u] = url
+			if age >= ttl:
+				stale += 1
+			if age > ttl * AVATAR_REFRESH_AHEAD:
+				ageing.append(u)
+		else:
+			missing.append(u)
+	if stale:
+		_count(stale_served=stale)
+	if ageing:
+		_count(refreshes=1)
+		submit_background(("avatars", size, circ, tuple(ageing)), _refresh_avatars, ageing, size, circ)
+	fresh = {}
+	for i in range(0, len(missing), AVATAR_BATCH_LIMIT):
+		chunk = missing[i:i + AVATAR_BATCH_LIMIT]
+		_count(fetches=1)
+		fetched = _fetch_avatar_urls(chunk, size, circular)
+		if fetched is None:
+			# API trouble: render placeholders and cache nothing, so the next view retries
+			result.update((u, "") for u in chunk)
+			continue
+		result.update(fetched)
+		fresh.update(fetched)
+	_store_avatars(fresh, size, circ, now)
+	return result
+
+
+def _count(**deltas):
+	# Request threads and the background refresh both count; unlocked += loses updates
+	with _avatar_stats_lock:
+		for name, n in deltas.items():
+			_avatar_stats[name] += n
+
+
+def get_avatar_url(user_id: int, size: str = "150x150", circular: bool = False) -> str:
+	"""Headshot URL for one Roblox user, or "" if there is none. See get_avatar_urls()."""
+	return get_avatar_urls([user_id], size, circular).get(int(user_id), "")
+
+
+def avatar_cache_stats() -> dict:
+	memory = _avatar_memory.stats()
+	with _avatar_stats_lock:
+		counters = dict(_avatar_stats)
+	return {
+		"memory_hits": memory["hits"],
+		"memory_misses": memory["misses"],
+		"memory_size": memory["size"],
+		**counters,
+	}
@@ -1,74 +1,214 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
-from .db import connect
+from .db import get_db
+from .cache import TTLCache
+from .roblox import AVATAR_TTL, get_avatar_urls
+from .conditional import conditional
+from . import events
 
 matches_bp = Blueprint("matches", __name__, url_prefix="/")
 
 
+def record_mutual_match(cur, user_id: int, target_id: int) -> bool:
+	"""After user_id likes target_id, store the pair if the like is reciprocated.
+
+	Runs on the caller's cursor so it shares the like's transaction. Returns
+	True only when a new mutual match was created.
+	"""
+	cur.execute(
+		"""
+		INSERT OR IGNORE INTO mutual_matches (user1_id, user2_id)
+		SELECT MIN(?1, ?2), MAX(?1, ?2)
+		WHERE EXISTS (SELECT 1 FROM matches WHERE swiper_id = ?2 AND swiped_id = ?1 AND action = 'like')
+		""",
+		(user_id, target_id),
+	)
+	return cur.rowcount == 1
+
+
+def remove_mutual_match(cur, user_id: int, other_id: int):
+	cur.execute(
+		"DELETE FROM mutual_matches WHERE user1_id = ? AND user2_id = ?",
+		(min(user_id, other_id), max(user_id, other_id)),
+	)
+
+
+# Messaging permission per canonical pair; an unmatch can take PAIR_TTL seconds to apply everywhere
+PAIR_TTL = 60
+PAIR_NEGATIVE_TTL = 10
+_pairs = TTLCache(maxsize=16384, ttl=PAIR_TTL)
+
+
+def can_message(user_id: int, other_id: int) -> bool:
+	"""Whether the two users are matched, via one primary-key probe at most."""
+	if user_id == other_id:
+		return False
+	key = (min(user_id, other_id), max(user_id, other_id))
+	allowed = _pairs.get(key)
+	if allowed is None:
+		allowed = is_mutual_match(user_id, other_id)
+		_pairs.set(key, allowed, ttl=PAIR_TTL if allowed else PAIR_NEGATIVE_TTL)
+	return allowed
+
+
+def forget_pair(user_id: int = None, other_id: int = None):
+	"""Drop the cached permission for one pair, or for every pair when called without ids."""
+	if user_id is None:
+		_pairs.clear()
+	else:
+		_pairs.pop((min(user_id, other_id), max(user_id, other_id)))
+
+
+def pair_cache_stats() -> dict:
+	return _pairs.stats()
+
+
+def is_mutual_match(user_id: int, other_id: int) -> bool:
+	cur = get_db().cursor()
+	cur.execute(
+		"SELECT 1 FROM mutual_matches WHERE user1_id = ? AND user2_id = ?",
+		(min(user_id, other_id), max(user_id, other_id)),
+	)
+	return cur.fetchone() is not None
+
+
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
+
+def get_conversation_page(user_id: int, other_id: int, before: int = None, limit: int = MESSAGE_PAGE_SIZE):
+	"""One page of a conversation, oldest first, ending just before message id `before`.
+
+	Returns (messages, has_more). Seeks idx_messages_conversation by (pair, id),
+	so the cost is the page size however long the conversation is.
+	"""
+	cur = get_db().cursor()
+	cur.execute(
+		"""
+		SELECT id, sender_id, receiver_id, message_content, sent_at, is_read
+		FROM messages
+		WHERE MIN(sender_id, receiver_id) = ? AND MAX(sender_id, receiver_id) = ? AND id < ?
+		ORDER BY id DESC
+		LIMIT ?
+		""",
+		(min(user_id, other_id), max(user_id, other_id), before if before is not None else 1 << 62, limit + 1),
+	)
+	rows = cur.fetchall()
+	return rows[:limit][::-1], len(rows) > limit
+
+
+INBOX_LIMIT = 100
+
+
+def get_inbox(user_id: int, limit: int = INBOX_LIMIT):
+	"""The user's conversations with current matches, most recent first, from conversation_summaries."""
+	cur = get_db().cursor()
+	cur.execute(
+		"""
+		SELECT s.peer_id, u.username, s.last_message_id, s.last_sender_id, s.last_content, s.last_sent_at, s.unread_count,
+			(SELECT rv.roblox_user_id FROM roblox_verification rv WHERE rv.user_id = s.peer_id) AS roblox_user_id
+		FROM conversation_summaries s
+		JOIN users u ON u.id = s.peer_id
+		JOIN mutual_matches mm ON mm.user1_id = MIN(s.user_id, s.peer_id) AND mm.user2_id = MAX(s.user_id, s.peer_id)
+		WHERE s.user_id = ?
+		ORDER BY s.last_message_id DESC
+		LIMIT ?
+		""",
+		(user_id, limit),
+	)
+	return cur.fetchall()
+
+
+def mark_read(user_id: int, peer_id: int) -> int:
+	"""Mark everything peer_id sent to user_id as read; returns how many messages changed."""
+	conn = get_db()
+	cur = conn.cursor()
+	# The summary row says whether there is anything to do without touching messages
+	cur.execute("SELECT unread_count FROM conversation_summaries WHERE user_id = ? AND peer_id = ?", (user_id, peer_id))
+	row = cur.fetchone()
+	if not row or not row["unread_count"]:
+		return 0
+	cur.execute(
+		"UPDATE messages SET is_read = TRUE WHERE sender_id = ? AND receiver_id = ? AND NOT COALESCE(is_read, 0)",
+		(peer_id, user_id),
+	)
+	conn.commit()
+	return cur.rowcount
+
+
 def _get_mutual_matches(user_id: int):
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute(
 		"""
-		SELECT u.* FROM users u
-		WHERE u.id != ?
-		AND EXISTS (
-			SELECT 1 FROM matches m1 WHERE m1.swiper_id = ? AND m1.swiped_id = u.id AND m1.action = 'like'
-		)
-		AND EXISTS (
-			SELECT 1 FROM matches m2 WHERE m2.swiper_id = u.id AND m2.swiped_id = ? AND m2.action = 'like'
-		)
+		SELECT u.*, (SELECT rv.roblox_user_id FROM roblox_verification rv WHERE rv.user_id = u.id) AS roblox_user_id
+		FROM mutual_matches mm
+		JOIN users u ON u.id = CASE WHEN mm.user1_id = ?1 THEN mm.user2_id ELSE mm.user1_id END
+		WHERE mm.user1_id = ?1 OR mm.user2_id = ?1
 		ORDER BY u.username COLLATE NOCASE
 		""",
-		(user_id, str(user_id), str(user_id)),
+		(user_id,),
 	)
 	rows = cur.fetchall()
-	conn.close()
 	return rows
 
 
+def matches_version(user_id: int):
+	# Adding or removing a match moves the count or the newest id; re-verifying moves verified_at (the avatar)
+	cur = get_db().cursor()
+	cur.execute(
+		"""
+		SELECT COUNT(*), MAX(mm.id), MAX(rv.verified_at)
+		FROM mutual_matches mm
+		LEFT JOIN roblox_verification rv ON rv.user_id = CASE WHEN mm.user1_id = ?1 THEN mm.user2_id ELSE mm.user1_id END
+		WHERE mm.user1_id = ?1 OR mm.user2_id = ?1
+		""",
+		(user_id,),
+	)
+	return tuple(cur.fetchone())
+
+
 @matches_bp.route("matches")
 @login_required
+@conditional(matches_version, rotate=AVATAR_TTL)
 def matches_list():
 	rows = _get_mutual_matches(current_user.id)
-	return render_template("matches.html", matches=rows)
+	avatars = get_avatar_urls(r["roblox_user_id"] for r in rows)
+	return render_template("matches.html", matches=rows, avatars=avatars)
+
+
+@matches_bp.route("inbox")
+@login_required
+def inbox():
+	rows = get_inbox(current_user.id)
+	avatars = get_avatar_urls(r["roblox_user_id"] for r in rows)
+	return render_template("inbox.html", conversations=rows, avatars=avatars)
 
 
 @matches_bp.route("messages/<int:other_id>", methods=["GET", "POST"])
 @login_required
 def conversation(other_id: int):
 	# Allow chatting only if mutual like
-	rows = _get_mutual_matches(current_user.id)
-	if not any(r["id"] == other_id for r in rows):
+	if not can_message(current_user.id, other_id):
 		flash("You can only message your matches", "error")
 		return redirect(url_for("matches.matches_list"))
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	if request.method == "POST":
 		content = request.form.get("content", "").strip()
 		if content:
 			cur.execute(
 				"INSERT INTO messages (sender_id, receiver_id, message_content) VALUES (?, ?, ?)",
-				(str(current_user.id), str(other_id), content),
+				(current_user.id, other_id, content),
 			)
 			conn.commit()
+			events.notify()
 			flash("Message sent", "success")
 		return redirect(url_for("matches.conversation", other_id=other_id))
-	# fetch conversation
-	cur.execute(
-		"""
-		SELECT m.*, u1.username AS sender_username, u2.username AS receiver_username
-		FROM messages m
-		JOIN users u1 ON u1.discord_id = m.sender_id
-		JOIN users u2 ON u2.discord_id = m.receiver_id
-		WHERE (m.sender_id = ? AND m.receiver_id = ?) OR (m.sender_id = ? AND m.receiver_id = ?)
-		ORDER BY m.sent_at ASC
-		""",
-		(str(current_user.id), str(other_id), str(other_id), str(current_user.id)),
-	)
-	msgs = cur.fetchall()
-	# get other user
-	cur.execute("SELECT * FROM users WHERE id = ?", (other_id,))
+	before = request.args.get("before", type=int)
+	if before is None:
+		mark_read(current_user.id, other_id)
+	msgs, has_more = get_conversation_page(current_user.id, other_id, before)
+	cur.execute("SELECT id, username FROM users WHERE id = ?", (other_id,))
 	other = cur.fetchone()
-	conn.close()
-	return render_template("conversation.html", other=other, messages=msgs)
+	return render_template("conversation.html", other=other, messages=msgs, has_more=has_more)
@@ -1,25 +1,44 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 import json
-from .db import connect
-from .roblox import resolve_roblox_username, check_roblox_verification, get_avatar_url
+from .db import get_db
+from .roblox import AVATAR_TTL, resolve_roblox_username, check_roblox_verification, get_avatar_url
+from .conditional import conditional
 import os
-import requests
+from . import http_client, verification
+from .auth import forget_user
 from urllib.parse import urlencode
 
 profile_bp = Blueprint("profile", __name__, url_prefix="/profile")
 
 
+def profile_version(user_id: int):
+	"""What /profile/view and /api/me render from, for their ETags: one indexed row."""
+	cur = get_db().cursor()
+	cur.execute(
+		"""
+		SELECT u.username, u.age, u.gender, u.bio, u.playstyle, u.server_preferences, u.timezone, u.availability, u.updated_at,
+			rv.roblox_user_id, rv.roblox_username, rv.is_verified, rv.verified_at
+		FROM users u
+		LEFT JOIN roblox_verification rv ON rv.user_id = u.id
+		WHERE u.id = ?
+		""",
+		(user_id,),
+	)
+	row = cur.fetchone()
+	return tuple(row) if row else None
+
+
 @profile_bp.route("/view")
 @login_required
+@conditional(profile_version, rotate=AVATAR_TTL)
 def view_profile():
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute("SELECT * FROM users WHERE id = ?", (current_user.id,))
 	user = cur.fetchone()
-	cur.execute("SELECT * FROM roblox_verification WHERE discord_id = ?", (str(current_user.id),))
+	cur.execute("SELECT * FROM roblox_verification WHERE user_id = ?", (current_user.id,))
 	rv = cur.fetchone()
-	conn.close()
 	server_prefs = []
 	if user and user["server_preferences"]:
 		try:
@@ -36,6 +55,7 @@ def view_profile():
 		server_prefs=server_prefs,
 		rv=rv,
 		avatar_url=avatar_url,
+		roblox_user_id=roblox_user_id,
 		is_verified=is_verified,
 		roblox_username=roblox_username,
 	)
@@ -51,7 +71,7 @@ def edit_profile():
 		playstyle = request.form.get("playstyle")
 		servers = request.form.get("servers", "")
 		server_preferences = json.dumps([s.strip() for s in servers.split(',') if s.strip()])
-		conn = connect()
+		conn = get_db()
 		cur = conn.cursor()
 		cur.execute(
 			"""
@@ -61,15 +81,14 @@ def edit_profile():
 			(age, gender, bio, playstyle, server_preferences, current_user.id),
 		)
 		conn.commit()
-		conn.close()
+		forget_user(current_user.id)
 		flash("Profile updated", "success")
 		return redirect(url_for("profile.view_profile"))
 	# load current
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute("SELECT * FROM users WHERE id = ?", (current_user.id,))
 	user = cur.fetchone()
-	conn.close()
 	return render_template("profile_edit.html", user=user)
 
 
@@ -83,7 +102,7 @@ def create_profile():
 		playstyle = request.form.get("playstyle")
 		servers = request.form.get("servers", "")
 		server_preferences = json.dumps([s.strip() for s in servers.split(',') if s.strip()])
-		conn = connect()
+		conn = get_db()
 		cur = conn.cursor()
 		cur.execute(
 			"""
@@ -93,7 +112,7 @@ def create_profile():
 			(age, gender, bio, playstyle, server_preferences, current_user.id),
 		)
 		conn.commit()
-		conn.close()
+		forget_user(current_user.id)
 		flash("Profile created/updated", "success")
 		return redirect(url_for("profile.view_profile"))
 	return render_template("profile_create.html")
@@ -148,7 +167,7 @@ def roblox_oauth_callback():
 		"redirect_uri": ROBLOX_REDIRECT_URI,
 	}
 	headers = {"Content-Type": "application/x-www-form-urlencoded"}
-	tr = requests.post(ROBLOX_TOKEN_URL, data=data, headers=headers, timeout=15)
+	tr = http_client.post(ROBLOX_TOKEN_URL, data=data, headers=headers, endpoint="roblox.oauth_token")
 	if tr.status_code != 200:
 		flash("Roblox token exchange failed", "error")
 		return redirect(url_for("profile.verify_roblox"))
@@ -157,7 +176,7 @@ def roblox_oauth_callback():
 	if not access_token:
 		flash("Roblox token missing", "error")
 		return redirect(url_for("profile.verify_roblox"))
-	ur = requests.get(ROBLOX_USERINFO_URL, headers={"Authorization": f"Bearer {access_token}"}, timeout=15)
+	ur = http_client.get(ROBLOX_USERINFO_URL, headers={"Authorization": f"Bearer {access_token}"}, endpoint="roblox.oauth_userinfo")
 	if ur.status_code != 200:
 		flash("Failed to fetch Roblox user", "error")
 		return redirect(url_for("profile.verify_roblox"))
@@ -172,17 +191,17 @@ def roblox_oauth_callback():
 		flash("Roblox user information incomplete", "error")
 		return redirect(url_for("profile.verify_roblox"))
 	# Mark verified
-	conn = connect()
+	conn = get_db()
 	cur = conn.cursor()
 	cur.execute(
 		"""
-		INSERT INTO roblox_verification (discord_id, roblox_username, roblox_user_id, is_verified, verified_at)
-		VALUES (?, ?, ?, 1, CURRENT_TIMESTAMP)
-		ON CONFLICT(discord_id) DO UPDATE SET roblox_username=excluded.roblox_username, roblox_user_id=excluded.roblox_user_id, is_verified=1, verified_at=CURRENT_TIMESTAMP
+		INSERT INTO roblox_verification (discord_id, user_id, roblox_username, roblox_user_id, is_verified, verified_at)
+		VALUES (?, ?, ?, ?, 1, CURRENT_TIMESTAMP)
+		ON CONFLICT(discord_id) DO UPDATE SET user_id=excluded.user_id, roblox_username=excluded.roblox_username, roblox_user_id=excluded.roblox_user_id, is_verified=1, verified_at=CURRENT_TIMESTAMP
 		""",
-		(str(current_user.id), roblox_username, roblox_user_id),
+		(str(current_user.id), current_user.id, roblox_username, roblox_user_id),
 	)
 	conn.commit()
-	conn.close()
+	verification.remember(current_user.id, True)
 	flash("Roblox account verified via OAuth", "success")
 	return redirect(url_for("profile.view_profile"))
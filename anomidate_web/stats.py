@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta, timezone
+from .db import get_db
+
+# Names in stats_daily, in dashboard order, with their chart labels
+DAILY_SERIES = (
+	("signups", "Signups"),
+	("swipes", "Swipes"),
+	("likes", "Likes"),
+	("matches", "Matches"),
+	("messages", "Messages"),
+)
+TREND_DAYS = 30
+
+
+def totals() -> dict:
+	"""Running totals from stats_counters (one row per counter)."""
+	cur = get_db().cursor()
+	cur.execute("SELECT name, value FROM stats_counters")
+	return {row["name"]: row["value"] for row in cur.fetchall()}
+
+
+def daily(days: int = TREND_DAYS):
+	"""Per-day counts for the last `days` UTC days as (day labels, {name: [values]})."""
+	today = datetime.now(timezone.utc).date()
+	labels = [(today - timedelta(days=n)).isoformat() for n in range(days - 1, -1, -1)]
+	series = {name: [0] * days for name, _ in DAILY_SERIES}
+	index = {day: i for i, day in enumerate(labels)}
+	cur = get_db().cursor()
+	# Primary-key range on (day, name): at most days * len(DAILY_SERIES) rows
+	cur.execute("SELECT day, name, value FROM stats_daily WHERE day >= ?", (labels[0],))
+	for row in cur.fetchall():
+		i = index.get(row["day"])
+		if i is not None and row["name"] in series:
+			series[row["name"]][i] = row["value"]
+	return labels, series
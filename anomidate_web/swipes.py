@@ -0,0 +1,160 @@
+import sqlite3
+from .db import get_db
+from . import events, quota
+from .routes_matches import forget_pair, record_mutual_match, remove_mutual_match
+
+MAX_BATCH_SWIPES = 100
+ACTIONS = ("like", "pass")
+
+# record_swipe() / record_swipes() outcomes
+LIMIT_REACHED = "limit"
+UNKNOWN_USER = "unknown"
+LIKED = "liked"
+MATCHED = "matched"
+PASSED = "passed"
+INVALID = "invalid"
+DUPLICATE = "duplicate"
+
+
+def _apply_swipe(cur, user_id: int, target_id: int, action: str) -> str:
+	cur.execute(
+		"""
+		INSERT INTO matches (swiper_id, swiped_id, action) VALUES (?, ?, ?)
+		ON CONFLICT(swiper_id, swiped_id) DO UPDATE SET action = excluded.action, created_at = CURRENT_TIMESTAMP
+		""",
+		(user_id, target_id, action),
+	)
+	if action == "like":
+		return MATCHED if record_mutual_match(cur, user_id, target_id) else LIKED
+	# A pass withdraws an earlier like
+	remove_mutual_match(cur, user_id, target_id)
+	return PASSED
+
+
+def record_swipe(user_id: int, target_id: int, action: str) -> str:
+	"""Apply one like or pass and return its outcome.
+
+	The swipe is charged to the in-memory quota (see quota.py) first; the
+	decision and mutual-match bookkeeping then happen in a single BEGIN
+	IMMEDIATE transaction. Nothing is written, and the quota is refunded, when
+	target_id does not exist.
+	"""
+	if not quota.take(user_id):
+		return LIMIT_REACHED
+	conn = get_db()
+	cur = conn.cursor()
+	conn.execute("BEGIN IMMEDIATE")
+	try:
+		outcome = _apply_swipe(cur, user_id, target_id, action)
+		conn.commit()
+	except sqlite3.IntegrityError:
+		# Foreign key: the target account is gone
+		conn.rollback()
+		quota.refund(user_id)
+		return UNKNOWN_USER
+	except Exception:
+		conn.rollback()
+		quota.refund(user_id)
+		raise
+	if outcome in (MATCHED, PASSED):
+		forget_pair(user_id, target_id)
+	if outcome == MATCHED:
+		events.notify()
+	return outcome
+
+
+def _existing_users(cur, user_ids) -> set:
+	user_ids = list(user_ids)
+	cur.execute("SELECT id FROM users WHERE id IN (%s)" % ",".join("?" * len(user_ids)), user_ids)
+	return {r[0] for r in cur.fetchall()}
+
+
+def record_swipes(user_id: int, decisions):
+	"""Apply a batch of (target_id, action) decisions in one transaction.
+
+	Returns (outcomes, matched_ids): one outcome per decision, in order, and
+	the users the batch newly matched with. Decisions are charged to the daily
+	quota in order until it runs out. If a target appears more than once only
+	its last decision applies; earlier ones come back as DUPLICATE.
+	"""
+	outcomes = [None] * len(decisions)
+	last = {}
+	for i, (target_id, action) in enumerate(decisions):
+		if action not in ACTIONS or type(target_id) is not int or target_id == user_id:
+			outcomes[i] = INVALID
+		else:
+			last[target_id] = i
+	for i, (target_id, _) in enumerate(decisions):
+		if outcomes[i] is None and last[target_id] != i:
+			outcomes[i] = DUPLICATE
+	if not last:
+		return outcomes, []
+	conn = get_db()
+	cur = conn.cursor()
+	existing = _existing_users(cur, last)
+	pending = []
+	for target_id, i in sorted(last.items(), key=lambda item: item[1]):
+		if target_id in existing:
+			pending.append((target_id, decisions[i][1], i))
+		else:
+			outcomes[i] = UNKNOWN_USER
+	applied = pending[:quota.take(user_id, len(pending))] if pending else []
+	for _, _, i in pending[len(applied):]:
+		outcomes[i] = LIMIT_REACHED
+	if not applied:
+		return outcomes, []
+	conn.execute("BEGIN IMMEDIATE")
+	try:
+		# Check again under the write lock: an account deleted since the first check
+		# would fail the whole batch on its foreign key
+		existing = _existing_users(cur, [t for t, _, _ in applied])
+		gone = [i for t, _, i in applied if t not in existing]
+		if gone:
+			applied = [a for a in applied if a[0] in existing]
+			for i in gone:
+				outcomes[i] = UNKNOWN_USER
+			quota.refund(user_id, len(gone))
+		cur.executemany(
+			"""
+			INSERT INTO matches (swiper_id, swiped_id, action) VALUES (?, ?, ?)
+			ON CONFLICT(swiper_id, swiped_id) DO UPDATE SET action = excluded.action, created_at = CURRENT_TIMESTAMP
+			""",
+			[(user_id, target_id, action) for target_id, action, _ in applied],
+		)
+		liked = [t for t, action, _ in applied if action == "like"]
+		matched = set()
+		if liked:
+			# Reciprocated likes that are not already a stored pair become new matches
+			marks = ",".join("?" * len(liked))
+			cur.execute(
+				f"""
+				SELECT m.swiper_id FROM matches m
+				WHERE m.swiped_id = ? AND m.action = 'like' AND m.swiper_id IN ({marks})
+				AND NOT EXISTS (
+					SELECT 1 FROM mutual_matches mm
+					WHERE mm.user1_id = MIN(m.swiper_id, m.swiped_id) AND mm.user2_id = MAX(m.swiper_id, m.swiped_id)
+				)
+				""",
+				[user_id, *liked],
+			)
+			matched = {r[0] for r in cur.fetchall()}
+			cur.executemany(
+				"INSERT OR IGNORE INTO mutual_matches (user1_id, user2_id) VALUES (?, ?)",
+				[(min(user_id, t), max(user_id, t)) for t in matched],
+			)
+		cur.executemany(
+			"DELETE FROM mutual_matches WHERE user1_id = ? AND user2_id = ?",
+			[(min(user_id, t), max(user_id, t)) for t, action, _ in applied if action == "pass"],
+		)
+		conn.commit()
+	except Exception:
+		conn.rollback()
+		quota.refund(user_id, len(applied))
+		raise
+	for target_id, action, i in applied:
+		outcomes[i] = PASSED if action == "pass" else MATCHED if target_id in matched else LIKED
+		if outcomes[i] != LIKED:
+			forget_pair(user_id, target_id)
+	if matched:
+		events.notify()
+	return outcomes, sorted(matched)
@@ -0,0 +1,36 @@
+import os
+from .cache import TTLCache
+from .db import get_db
+
+# roblox_verification.is_verified for the request gate, stale for up to VERIFIED_TTL.
+# Unverified answers expire quickly since the user is about to verify.
+VERIFIED_TTL = int(os.getenv("VERIFICATION_CACHE_TTL", "600"))
+UNVERIFIED_TTL = 30
+_verified = TTLCache(maxsize=16384, ttl=VERIFIED_TTL)
+
+
+def is_verified(user_id: int) -> bool:
+	verified = _verified.get(user_id)
+	if verified is None:
+		cur = get_db().cursor()
+		cur.execute("SELECT is_verified FROM roblox_verification WHERE user_id = ?", (user_id,))
+		row = cur.fetchone()
+		verified = bool(row and row["is_verified"])
+		remember(user_id, verified)
+	return verified
+
+
+def remember(user_id: int, verified: bool):
+	_verified.set(user_id, verified, ttl=VERIFIED_TTL if verified else UNVERIFIED_TTL)
+
+
+def invalidate(user_id: int = None):
+	"""Forget one user's cached state, or everyone's when user_id is None."""
+	if user_id is None:
+		_verified.clear()
+	else:
+		_verified.pop(user_id)
+
+
+def cache_stats() -> dict:
+	return _verified.stats()
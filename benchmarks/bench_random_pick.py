@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Compare random candidate selection strategies on synthetic user tables.
+
+    python benchmarks/bench_random_pick.py --sizes 10000 100000 1000000
+
+For each size a throwaway database is built with that many verified users,
+and a viewer who has already swiped --swiped of them. Each strategy is then
+timed over --rounds picks:
+
+  order_by_random      the old /api/swipe/next query (no exclusion at all)
+  order_by_random_excl ORDER BY RANDOM() with the same exclusions as the engine
+  random_seek          candidates.pick_candidate()
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def build(db, size: int, swiped: float):
+	conn = db.connect()
+	conn.execute("PRAGMA synchronous=OFF")
+	conn.execute("BEGIN")
+	conn.executemany(
+		"INSERT INTO users (username, age, gender, playstyle) VALUES (?, ?, ?, ?)",
+		((f"user{i}", random.randint(13, 40), random.choice(("M", "F")), random.choice(("casual", "competitive"))) for i in range(size)),
+	)
+	conn.executemany(
+		"INSERT INTO roblox_verification (discord_id, user_id, roblox_username, roblox_user_id, is_verified) VALUES (?, ?, ?, ?, 1)",
+		((str(i), i, f"rbx{i}", 1000 + i) for i in range(1, size + 1)),
+	)
+	viewer = 1
+	conn.executemany(
+		"INSERT INTO matches (swiper_id, swiped_id, action) VALUES (?, ?, 'pass')",
+		((viewer, t) for t in random.sample(range(2, size + 1), int((size - 1) * swiped))),
+	)
+	conn.commit()
+	conn.execute("ANALYZE")
+	conn.close()
+	return viewer
+
+
+def timed(fn, rounds: int):
+	samples = []
+	for _ in range(rounds):
+		start = time.perf_counter()
+		fn()
+		samples.append((time.perf_counter() - start) * 1000)
+	return statistics.median(samples), max(samples)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+	parser.add_argument("--swiped", type=float, default=0.5, help="fraction of users the viewer already swiped")
+	parser.add_argument("--rounds", type=int, default=50)
+	args = parser.parse_args(argv)
+
+	print(f"{'users':>10}  {'strategy':<22} {'p50 ms':>9} {'max ms':>9}")
+	for size in args.sizes:
+		with tempfile.TemporaryDirectory() as tmp:
+			from anomidate_web import db, candidates
+			db.DB_PATH = Path(tmp) / "bench.db"
+			db.close_db()
+			db.migrate()
+			viewer = build(db, size, args.swiped)
+			conn = db.get_db()
+			where, params = candidates._where(viewer, {})
+			strategies = {
+				"order_by_random": lambda: conn.execute(
+					"SELECT id, username, age, gender, playstyle, server_preferences, bio FROM users WHERE id != ? ORDER BY RANDOM() LIMIT 1",
+					(viewer,),
+				).fetchone(),
+				"order_by_random_excl": lambda: conn.execute(
+					f"SELECT {candidates.CANDIDATE_COLUMNS} FROM users u WHERE {where} ORDER BY RANDOM() LIMIT 1",
+					params,
+				).fetchone(),
+				"random_seek": lambda: candidates.pick_candidate(viewer),
+			}
+			for name, fn in strategies.items():
+				p50, worst = timed(fn, args.rounds)
+				print(f"{size:>10}  {name:<22} {p50:>9.3f} {worst:>9.3f}")
+			db.close_db()
+
+
+if __name__ == "__main__":
+	main()